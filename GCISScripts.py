@@ -50,6 +50,16 @@ def verify_presets(config) -> set:
             preset.append([0, 0, 0])
         if not isinstance(preset[-1], str) and len(preset) < 7:
             preset.append('GitHub')
+        if len(preset) < 8:
+            preset.append('Full')
+        if len(preset) < 9:
+            preset.append(0)
+        if len(preset) < 10:
+            preset.append(0)
+        if len(preset) < 11:
+            preset.append([])
+        if len(preset) < 12:
+            preset.append([])
     return invalid_fields
 
 def verify_github_conf(config) -> set:
@@ -119,11 +129,12 @@ def main():
         kernel32.SetConsoleMode(kernel32.GetStdHandle(-11), 7)
 
     # Define Dependencies
-    git = Dependency('git', '2.30', '')  # clone repoes with cli
+    git = Dependency('git', '2.35', '')  # clone repoes with cli
     niquests = Dependency('niquests', '3.12.0', 'pip')  # http client
     orjson = Dependency('orjson', '3.10.0', 'pip')  # fast json parser
 
     # Platform dependent dependency
+    # Optional, the asyncio clone engine uses it when installed
     # fast_evenloop = Dependency('uvloop', '0.21.0', 'pip') if os.name != 'nt' else Dependency('winloop', '0.1.8', 'pip')
 
     # Define Config Entries
@@ -179,6 +190,103 @@ def main():
         prompt=True,
         is_bool_prompt=True,
     )
+    update_clone_in_place = ConfigEntry(
+        'update_clone_in_place',
+        'Update Duplicate Output Folder In Place',
+        False,
+        'When replacing an output folder, update repos already cloned there instead of recloning them?',
+        prompt=True,
+        is_bool_prompt=True,
+    )
+    use_mirror_cache = ConfigEntry(
+        'use_mirror_cache',
+        'Use Local Mirror Cache',
+        False,
+        'Keep local mirrors of cloned repos so repeated clones only fetch new commits?',
+        prompt=True,
+        is_bool_prompt=True,
+    )
+    use_git_proxy = ConfigEntry(
+        'use_git_proxy',
+        'Use Caching Git Proxy',
+        False,
+        'Clone through a local caching git server that fetches each repo from upstream at most once every few minutes (TAs sharing a mirror folder share its fetches)?',
+        prompt=True,
+        is_bool_prompt=True,
+    )
+    git_proxy_refresh_seconds = ConfigEntry('git_proxy_refresh_seconds', 'Git Proxy Refresh (seconds)', 300, None, prompt=False)
+    git_transport = ConfigEntry(
+        'git_transport',
+        'Git Transport',
+        'HTTPS',
+        'Git Transport (HTTPS, or SSH with your ssh key sharing one connection per host): ',
+        prompt=True,
+        is_multichoice_prompt=True,
+        multichoice_options=['HTTPS', 'SSH'],
+    )
+    ssh_control_persist = ConfigEntry('ssh_control_persist', 'SSH Connection Persist (seconds)', 60, None, prompt=False)
+    git_proxy_port = ConfigEntry('git_proxy_port', 'Git Proxy Port', 0, None, prompt=False)
+    mirror_cache_dir = ConfigEntry('mirror_cache_dir', 'Mirror Cache Folder', '', None, prompt=False)
+    share_run_objects = ConfigEntry(
+        'share_run_objects',
+        'Share Objects Between Clones',
+        False,
+        'Store starter code objects once per output folder and share them between clones (repos depend on its hidden .objects.git folder)?',
+        prompt=True,
+        is_bool_prompt=True,
+    )
+    defer_checkout = ConfigEntry(
+        'defer_checkout',
+        'Defer Checkout',
+        False,
+        'Clone without checking out files and write working trees in a separate disk limited stage (helps on slow disks)?',
+        prompt=True,
+        is_bool_prompt=True,
+    )
+    trim_clone_history = ConfigEntry(
+        'trim_clone_history',
+        'Trim Clone History',
+        False,
+        'Only clone history from a window before the due datetime (Full strategy), fetching more if the due commit is older?',
+        prompt=True,
+        is_bool_prompt=True,
+    )
+    history_window_days = ConfigEntry('history_window_days', 'History Window (days)', 14, None, prompt=False)
+    index_cloned_repos = ConfigEntry(
+        'index_cloned_repos',
+        'Index Cloned Repos',
+        False,
+        'Write commit-graph and multi-pack-index files into cloned repos in the background, so git log, blame and diff on them are faster?',
+        prompt=True,
+        is_bool_prompt=True,
+    )
+    trace_git_phases = ConfigEntry(
+        'trace_git_phases',
+        'Trace Git Phases',
+        False,
+        'Record how long negotiation, pack download, index-pack and checkout take in each clone (git trace2) and add the totals to the clone report?',
+        prompt=True,
+        is_bool_prompt=True,
+    )
+    clone_engine = ConfigEntry(
+        'clone_engine',
+        'Clone Engine',
+        'Threads',
+        'Clone Engine (Threads or Asyncio): ',
+        prompt=True,
+        is_multichoice_prompt=True,
+        multichoice_options=['Threads', 'Asyncio'],
+    )
+    hedge_slow_clones = ConfigEntry(
+        'hedge_slow_clones',
+        'Hedge Slow Clones',
+        False,
+        'Start a second attempt of clones running slower than 95% of clones so far, keeping whichever finishes first?',
+        prompt=True,
+        is_bool_prompt=True,
+    )
+    git_timeouts = ConfigEntry('git_timeouts', 'Git Timeouts (seconds)', {'clone': 900, 'fetch': 900, 'reset': 300, 'other': 120}, None, prompt=False)
+    git_retries = ConfigEntry('git_retries', 'Git Retries', 2, None, prompt=False)
     presets = ConfigEntry('presets', 'Presets', [], None, prompt=False)
     clone_history = ConfigEntry('clone_history', 'Clone History', [], None, prompt=False)
     student_params = ConfigEntry('extra_student_parameters', 'Extra Student Parameters', [], None, prompt=False)
@@ -199,6 +307,24 @@ def main():
         students_csv,
         out_dir_entry,
         replace_clone_duplicates,
+        update_clone_in_place,
+        use_mirror_cache,
+        use_git_proxy,
+        git_proxy_refresh_seconds,
+        git_transport,
+        ssh_control_persist,
+        git_proxy_port,
+        mirror_cache_dir,
+        share_run_objects,
+        defer_checkout,
+        trim_clone_history,
+        history_window_days,
+        index_cloned_repos,
+        trace_git_phases,
+        clone_engine,
+        hedge_slow_clones,
+        git_timeouts,
+        git_retries,
         presets,
         clone_history,
         student_params,
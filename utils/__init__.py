@@ -53,6 +53,38 @@ def multichoice_prompt(prompt: str, options: list, default_index: int):
         print(f'{LIGHT_RED}Invalid option. Please choose one of the options above.{WHITE}')
 
 
+def megabytes_prompt(prompt: str) -> int:
+    """
+    Whole number of MB, enter for 0
+    """
+    result = input(prompt)
+    while result and not result.isdigit():
+        result = input(f'{LIGHT_RED}Enter a whole number of MB.{WHITE}\n{prompt}')
+    return int(result) if result else 0
+
+
+def hours_list_prompt(prompt: str) -> list[int]:
+    """
+    Comma separated whole numbers of hours, enter for none
+    """
+    result = input(prompt)
+    while result and not all(hours.strip().isdigit() for hours in result.split(',')):
+        result = input(f'{LIGHT_RED}Enter whole numbers of hours separated by commas (e.g. 24,48).{WHITE}\n{prompt}')
+    return sorted({int(hours) for hours in result.split(',') if int(hours) > 0}) if result else []
+
+
+def folders_list_prompt(prompt: str) -> list[str]:
+    """
+    Comma separated folders relative to the repo root (e.g. src/part2), enter for none
+    """
+    result = input(prompt)
+    folders = [folder.strip().replace('\\', '/').strip('/') for folder in result.split(',')] if result else []
+    while any(not folder or folder.startswith('-') or '..' in folder.split('/') or any(char in folder for char in '*?[') for folder in folders):
+        result = input(f'{LIGHT_RED}Enter folders relative to the repo root separated by commas, without wildcards (e.g. src/part2,docs).{WHITE}\n{prompt}')
+        folders = [folder.strip().replace('\\', '/').strip('/') for folder in result.split(',')] if result else []
+    return list(dict.fromkeys(folders))
+
+
 def get_color_from_status(status) -> str:
     import versionmanagerpy
 
@@ -141,22 +173,50 @@ def run_cmd(cmd: str | list, cwd=None) -> tuple[str | None, str | None]:
     return (stdout.decode().strip() if stdout else None, stderr.decode().strip() if stderr else None, proc.returncode)
 
 
-async def async_run_cmd(cmd: str | list, cwd=None) -> tuple[str | None, str | None]:
+def kill_process_tree(proc) -> None:
+    """
+    Kill a process and the helpers it started (git-remote-https, index-pack), which would otherwise keep its pipes open.
+    On POSIX the process must have been started with start_new_session=True.
+    """
+    if proc.returncode is not None:
+        return
+    if os.name == 'nt':
+        subprocess.run(['taskkill', '/F', '/T', '/PID', str(proc.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return
+    import signal
+
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        proc.kill()
+
+
+async def async_run_cmd(cmd: str | list, cwd=None, timeout: float = None, env: dict = None) -> tuple[str | None, str | None]:
     """
     Asyncronously start a subprocess and run a command returning its output
+    The process is killed if it runs longer than timeout seconds or the task running it is cancelled, env replaces the environment it inherits if given
     """
     if cwd is None:
         cwd = os.getcwd()
-    proc = await asyncio.create_subprocess_exec(*cmd, cwd=cwd, stderr=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
-
-    stdout, stderr = await proc.communicate()
+    proc = await asyncio.create_subprocess_exec(*cmd, cwd=cwd, stderr=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, start_new_session=timeout is not None, env=env)
+
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        kill_process_tree(proc)
+        stdout, stderr = await proc.communicate()
+        stderr = (stderr or b'') + f'\ntimed out after {timeout}s'.encode()
+    except asyncio.CancelledError:
+        kill_process_tree(proc)
+        await proc.wait()
+        raise
     return (stdout.decode().strip() if stdout else None, stderr.decode().strip() if stderr else None, proc.returncode)
 
 
 def list_to_clone_preset(args: list) -> ClonePreset | None:
-    if len(args) != 7:
+    if len(args) < 7:
         return
-    return ClonePreset(args[0], args[1], args[2], args[3], args[4], args[5], args[6])
+    return ClonePreset(*args)
 
 
 def list_to_multi_clone_presets(presets: list) -> list:
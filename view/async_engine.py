@@ -0,0 +1,156 @@
+import asyncio
+
+from threading import Thread
+from time import perf_counter
+
+from .concurrency import AdaptiveLimiter, is_network_git_cmd, release_git_limiter
+from .git_trace import GitTrace
+from .retry_policy import GitRetryPolicy, discard_clone_target, hedge_clone_cmd, keep_hedge_clone
+from utils import async_run_cmd
+
+DEFAULT_MAX_GIT_PROCESSES = 64
+
+
+def new_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Use uvloop (winloop on Windows) if it is installed, otherwise the default asyncio loop
+    """
+    try:
+        import uvloop as fast_eventloop
+    except ImportError:
+        try:
+            import winloop as fast_eventloop
+        except ImportError:
+            return asyncio.new_event_loop()
+    return fast_eventloop.new_event_loop()
+
+
+class AsyncCloneEngine:
+    """
+    Runs clone work as coroutines on a single event loop thread.
+    Concurrent git processes are bounded by a semaphore instead of by a thread pool size,
+    so hundreds of clones can be in flight without hundreds of OS threads.
+    """
+
+    def __init__(self, max_processes: int = DEFAULT_MAX_GIT_PROCESSES, limiter: AdaptiveLimiter = None, policy: GitRetryPolicy = None) -> None:
+        self.max_processes = max(1, int(max_processes))
+        self.limiter = limiter
+        self.policy = policy
+        self.loop = None
+        self.thread = None
+        self.semaphore = None
+        self.futures = []
+
+    def start(self) -> None:
+        self.loop = new_event_loop()
+        self.semaphore = asyncio.Semaphore(self.max_processes)
+        self.thread = Thread(target=self.loop.run_forever, name='async-clone-engine', daemon=True)
+        self.thread.start()
+
+    def submit(self, coroutine):
+        """
+        Schedule a coroutine on the engine loop from any thread
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        self.futures.append(future)
+        return future
+
+    async def run_cmd(self, cmd: list, cwd=None, env: dict = None) -> tuple[str | None, str | None, int]:
+        """
+        Run one git command, network commands also wait for a slot from the adaptive limiter.
+        With a policy the command is killed after its phase timeout and transient network failures are retried with backoff.
+        """
+        attempt = 0
+        while True:
+            result = await self.run_cmd_once(cmd, cwd, env)
+            if self.policy is None or attempt >= self.policy.max_retries or not self.policy.is_retryable(cmd, result):
+                return result
+            attempt += 1
+            self.policy.count_retry()
+            discard_clone_target(cmd, cwd)
+            await asyncio.sleep(self.policy.backoff(attempt))
+
+    async def run_cmd_once(self, cmd: list, cwd=None, env: dict = None) -> tuple[str | None, str | None, int]:
+        is_network = self.limiter is not None and is_network_git_cmd(cmd)
+        if is_network:
+            await self.limiter.async_acquire()
+        start = perf_counter()
+        result = None
+        try:
+            async with self.semaphore:
+                hedge_after = self.policy.hedge_after(cmd) if self.policy is not None else None
+                if hedge_after is not None:
+                    result = await self.run_hedged_clone(cmd, cwd, hedge_after, env)
+                else:
+                    result = await async_run_cmd(cmd, cwd=cwd, timeout=self.policy.timeout_for(cmd) if self.policy is not None else None, env=env)
+            return result
+        finally:
+            if is_network:
+                release_git_limiter(self.limiter, perf_counter() - start, result)
+            if self.policy is not None:
+                self.policy.record(cmd, perf_counter() - start, result)
+
+    async def run_hedged_clone(self, cmd: list, cwd, hedge_after: float, env: dict = None) -> tuple[str | None, str | None, int]:
+        """
+        Async counterpart of `run_hedged_clone`, the hedge only starts if a process and a clone slot are free
+        """
+        timeout = self.policy.timeout_for(cmd)
+        primary = asyncio.ensure_future(async_run_cmd(cmd, cwd=cwd, timeout=timeout, env=env))
+        done, _ = await asyncio.wait([primary], timeout=hedge_after)
+        if done or self.semaphore.locked() or (self.limiter is not None and not self.limiter.try_acquire()):
+            return await primary
+        hedge_start = perf_counter()
+        async with self.semaphore:
+            hedge = asyncio.ensure_future(async_run_cmd(hedge_clone_cmd(cmd), cwd=cwd, timeout=timeout, env=env))
+            winner = None
+            pending = {primary, hedge}
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in (primary, hedge) if task in done and task.result()[2] == 0), None)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        hedge_won = winner is hedge
+        if self.limiter is not None and hedge_won:
+            release_git_limiter(self.limiter, perf_counter() - hedge_start, hedge.result())
+        elif self.limiter is not None:
+            self.limiter.release_slot()
+        self.policy.count_hedge(hedge_won)
+        keep_hedge_clone(cmd, cwd, hedge_won)
+        return hedge.result() if hedge_won else primary.result()
+
+    async def run_steps(self, steps, trace: GitTrace = None, env: dict = None) -> tuple[str | None, str | None, int]:
+        """
+        Async counterpart of `run_steps`, each (cmd, cwd) the generator yields runs as an asyncio subprocess
+        """
+        try:
+            cmd, cwd = next(steps)
+            while True:
+                if trace is None:
+                    result = await self.run_cmd(cmd, cwd, env)
+                else:
+                    traced_cmd, traced_env = trace.wrap(cmd, env)
+                    result = trace.collect(traced_cmd, await self.run_cmd(traced_cmd, cwd, traced_env))
+                cmd, cwd = steps.send(result)
+        except StopIteration as e:
+            return e.value
+
+    def join(self) -> list[Exception]:
+        """
+        Wait for every submitted coroutine, returns the exceptions raised by any of them
+        """
+        errors = []
+        for future in self.futures:
+            error = future.exception()
+            if error is not None:
+                errors.append(error)
+        self.futures.clear()
+        return errors
+
+    def close(self) -> None:
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
@@ -0,0 +1,186 @@
+import csv
+import json
+import os
+import sys
+
+from io import StringIO
+from pathlib import Path
+from threading import Lock, Thread, get_ident
+
+from .async_engine import AsyncCloneEngine
+from .clone_preset import ClonePreset
+from .retry_policy import GitRetryPolicy
+from .source_api_client import LogHandler, LogLevel, VALID_DATE_REGEX, VALID_TIME_REGEX, main, make_git_proxy, make_io_scheduler, make_ssh_multiplexer
+
+from utils import list_to_multi_clone_presets
+from tuiframeworkpy import LIGHT_GREEN, LIGHT_RED, CYAN, WHITE
+
+BATCH_FIELDS = ('preset', 'prefix', 'due_date', 'due_time')
+
+
+class BatchEntry:
+    __slots__ = ['preset', 'repo_prefix', 'due_date', 'due_time']
+
+    def __init__(self, preset: ClonePreset, repo_prefix: str, due_date: str, due_time: str) -> None:
+        self.preset = preset
+        self.repo_prefix = repo_prefix
+        self.due_date = due_date
+        self.due_time = due_time
+
+    def __repr__(self) -> str:
+        return f'BatchEntry(preset: {self.preset.name}, repo_prefix: {self.repo_prefix}, due_date: {self.due_date}, due_time: {self.due_time})'
+
+
+class SharedRun:
+    """
+    Resources shared by every assignment in a batch: one API client (session and request limiter) per clone source,
+    one I/O scheduler (with the git clone and checkout limiters) all clients run on, one retry policy, one clone engine, one caching git proxy and one set of shared ssh connections, so the whole batch is scheduled as a single run.
+    """
+
+    def __init__(self, config) -> None:
+        self.config = config
+        self.debug = config.debug
+        self.log_handler = LogHandler(LogLevel.DEBUG if self.debug else LogLevel.CRITICAL)
+        self.log_handler.censored_strs.extend(token for token in (config.github_token, config.gitlab_token) if token)
+        if self.debug:
+            # each assignment logs its own run to its folder, the API requests of the whole batch go here
+            os.makedirs(config.out_dir, exist_ok=True)
+            self.log_handler.open(f'{config.out_dir}/batch_log.txt')
+        self.scheduler = make_io_scheduler()
+        self.git_limiter = self.scheduler.git_limiter
+        self.checkout_limiter = self.scheduler.checkout_limiter
+        self.retry_policy = GitRetryPolicy.from_config(config)
+        self.clone_engine = None
+        if config.clone_engine == 'Asyncio':
+            self.clone_engine = AsyncCloneEngine(limiter=self.git_limiter, policy=self.retry_policy)
+            self.clone_engine.start()
+        self.ssh = make_ssh_multiplexer(config) if config.git_transport == 'SSH' else None
+        self.git_proxy = make_git_proxy(config, self.retry_policy, self.ssh.git_env() if self.ssh is not None else None) if config.use_git_proxy else None
+        self.clients = {}
+        self.lock = Lock()
+
+    def get_client(self, client_type):
+        with self.lock:
+            if client_type not in self.clients:
+                self.clients[client_type] = client_type(self.config, self.log_handler)
+                self.clients[client_type].scheduler = self.scheduler
+                self.clients[client_type].git_proxy = self.git_proxy
+                self.clients[client_type].ssh = self.ssh
+            return self.clients[client_type]
+
+    def close(self) -> None:
+        if self.clone_engine is not None:
+            self.clone_engine.join()
+            self.clone_engine.close()
+        if self.git_proxy is not None:
+            self.git_proxy.close()
+        if self.ssh is not None:
+            self.ssh.close()
+        for client in self.clients.values():
+            client.close()
+        self.scheduler.close()
+        self.clients.clear()
+        self.log_handler.close()
+
+
+class ThreadStdout:
+    """
+    Stand in for sys.stdout that sends prints from registered threads to their own buffer,
+    so assignments running at the same time do not interleave their output.
+    """
+
+    def __init__(self, stream) -> None:
+        self.stream = stream
+        self.buffers = {}
+
+    def write(self, text: str) -> int:
+        return self.buffers.get(get_ident(), self.stream).write(text)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def read_batch_file(path: Path | str, presets: list[ClonePreset], config) -> list[BatchEntry]:
+    """
+    Read a csv (with a header row) or json list of entries with the keys preset, prefix, due_date and due_time.
+    preset is the name of a saved preset and may be left empty, due_time may be left empty if the preset has a clone time.
+    Raises ValueError describing the first invalid entry.
+    """
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix.lower() == '.json':
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+    if not isinstance(rows, list) or not rows:
+        raise ValueError(f'{path} has no entries.')
+
+    presets_by_name = {preset.name: preset for preset in presets if preset is not None}
+    entries = []
+    out_folders = set()
+    for i, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            raise ValueError(f'Entry {i}: expected an object with the keys {", ".join(BATCH_FIELDS)}.')
+        row = {key.strip().lower(): str(value).strip() for key, value in row.items() if key and value is not None}
+        preset_name = row.get('preset', '')
+        if preset_name and preset_name not in presets_by_name:
+            raise ValueError(f'Entry {i}: preset `{preset_name}` does not exist.')
+        if preset_name:
+            preset = presets_by_name[preset_name]
+        else:
+            preset = ClonePreset('', '', '', config.students_csv, False, (0, 1, 0), config.default_clone_source)
+        repo_prefix = row.get('prefix', '')
+        due_date = row.get('due_date', '')
+        due_time = row.get('due_time', '') or preset.clone_time
+        if not repo_prefix:
+            raise ValueError(f'Entry {i}: prefix is required.')
+        if not VALID_DATE_REGEX.match(due_date):
+            raise ValueError(f'Entry {i}: due_date `{due_date}` is not in yyyy-mm-dd format.')
+        if not VALID_TIME_REGEX.match(due_time):
+            raise ValueError(f'Entry {i}: due_time `{due_time}` is not in 24hr HH:MM format.')
+        out_folder = (repo_prefix, preset.folder_suffix, due_date if preset.append_timestamp else '', due_time if preset.append_timestamp else '')
+        if out_folder in out_folders:
+            raise ValueError(f'Entry {i}: another entry already clones `{repo_prefix}` into the same output folder.')
+        out_folders.add(out_folder)
+        entries.append(BatchEntry(preset, repo_prefix, due_date, due_time))
+    return entries
+
+
+def run_batch(batch_path: Path | str, dry_run: bool, config_manager) -> None:
+    """
+    Clone every assignment in a batch file at the same time, sharing one API session and one clone scheduler.
+    Each assignment's output is printed once it is done.
+    """
+    try:
+        entries = read_batch_file(batch_path, list_to_multi_clone_presets(config_manager.config.presets), config_manager.config)
+    except (OSError, ValueError, json.JSONDecodeError) as e:
+        print(f'{LIGHT_RED}Unable to read batch file: {e}{WHITE}')
+        return
+
+    print(f'{CYAN}[INFO]: Cloning {len(entries)} assignments: {", ".join(entry.repo_prefix for entry in entries)}{WHITE}')
+    shared = SharedRun(config_manager.config)
+    stdout = ThreadStdout(sys.stdout)
+    buffers = [StringIO() for _ in entries]
+
+    def run_entry(entry: BatchEntry, buffer: StringIO) -> None:
+        stdout.buffers[get_ident()] = buffer
+        try:
+            main(entry.preset, dry_run, config_manager, batch_entry=entry, batch=shared)
+        except Exception as e:
+            print(f'{LIGHT_RED}Clone of `{entry.repo_prefix}` failed: {e!r}{WHITE}')
+
+    threads = [Thread(target=run_entry, args=(entry, buffer), name=f'batch-{entry.repo_prefix}', daemon=True) for entry, buffer in zip(entries, buffers)]
+    sys.stdout = stdout
+    try:
+        for thread in threads:
+            thread.start()
+        for entry, thread, buffer in zip(entries, threads, buffers):
+            thread.join()
+            stdout.stream.write(f'\n{LIGHT_GREEN}*** {entry.repo_prefix} ({entry.due_date} {entry.due_time}) ***{WHITE}\n{buffer.getvalue()}')
+            stdout.stream.flush()
+    finally:
+        sys.stdout = stdout.stream
+        shared.close()
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import shutil
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from .clone_report import CloneReport
+from .retry_policy import DEFAULT_GIT_TIMEOUTS
+from .source_api_client import RESUMABLE_CLONED_STATUSES, get_students, run_cmd
+
+from utils import onerror
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+MISSING_OBJECTS_PER_FETCH = 500  # keeps the fetch command line under Windows' length limit
+
+
+def file_sha256(path: Path | str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_plain_name(name) -> bool:
+    """
+    True if name is a single file or folder name, a manifest from someone else must not point outside the folders it is loaded into
+    """
+    return isinstance(name, str) and name not in ('', '.', '..') and '/' not in name and '\\' not in name and Path(name).name == name
+
+
+def fetch_missing_objects(repo_path: Path) -> tuple[str | None, str | None, int]:
+    """
+    Download the objects a partial clone left out of the history of HEAD, each fetch is killed after the git fetch timeout.
+    Left to itself `git bundle create` would fetch them one at a time with no time limit.
+    """
+    stdout, stderr, exitcode = run_cmd(['git', 'rev-list', '--objects', '--missing=print', 'HEAD'], cwd=repo_path)
+    if exitcode != 0:
+        return stdout, stderr, exitcode
+    missing = [line[1:] for line in (stdout or '').splitlines() if line.startswith('?')]
+    result = None, None, 0
+    for i in range(0, len(missing), MISSING_OBJECTS_PER_FETCH):
+        # the fetch git itself runs for a missing object, only with every object of the batch at once
+        cmd = ['git', '-c', 'fetch.negotiationAlgorithm=noop', 'fetch', '-q', '--no-tags', '--no-write-fetch-head', '--recurse-submodules=no', '--filter=blob:none', 'origin']
+        result = run_cmd(cmd + missing[i : i + MISSING_OBJECTS_PER_FETCH], cwd=repo_path, timeout=DEFAULT_GIT_TIMEOUTS['fetch'])
+        if result[2] != 0:
+            break
+    return result
+
+
+def bundle_repo(repo_path: Path, bundle_path: Path) -> tuple[dict | None, str | None]:
+    """
+    Write the history of the commit checked out in repo_path to bundle_path.
+    Returns the manifest entry, or None and why the repo could not be bundled.
+    Files a partial clone left out are downloaded from origin first, a shallow clone is missing the history a bundle needs.
+    """
+    if not (repo_path / '.git').exists():
+        return None, 'not a git clone'
+    stdout, stderr, exitcode = run_cmd(['git', 'rev-parse', '--is-shallow-repository', 'HEAD'], cwd=repo_path)
+    if exitcode != 0:
+        return None, stderr or 'no commit checked out'
+    is_shallow, commit_hash = stdout.split()
+    if is_shallow == 'true':
+        return None, 'shallow clone, its history before the due commit was not cloned'
+    stdout, _, _ = run_cmd(['git', 'config', '--get', 'remote.origin.promisor'], cwd=repo_path)
+    if stdout == 'true':
+        _, stderr, exitcode = fetch_missing_objects(repo_path)
+        if exitcode != 0:
+            return None, f'partial clone, the files it left out could not be downloaded: {stderr or "git fetch failed"}'
+    _, stderr, exitcode = run_cmd(['git', 'bundle', 'create', '-q', str(bundle_path.absolute()), 'HEAD'], cwd=repo_path)
+    if exitcode != 0:
+        return None, stderr or 'git bundle failed'
+    return {'name': repo_path.name, 'commit': commit_hash, 'bundle': bundle_path.name, 'bytes': bundle_path.stat().st_size, 'sha256': file_sha256(bundle_path)}, None
+
+
+def export_bundles(report: CloneReport, export_dir: Path | str, students_csv: str = None) -> dict:
+    """
+    Bundle every repo a clone run finished into export_dir, next to a manifest `load_bundles` reads.
+    A bundle holds the history up to the due commit and no remote, so the token used to clone never leaves this machine.
+    If students_csv is given only those students' repos are exported, to hand a grader their slice of the class.
+    """
+    export_dir = Path(export_dir)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    out_names = [out_name for out_name, status, *_ in getattr(report, 'repo_outcomes', ()) if status in RESUMABLE_CLONED_STATUSES]
+    if students_csv:
+        slice_names = {f'{report.assignment_name}-{name}' for name in get_students(students_csv).values()}
+        out_names = [out_name for out_name in out_names if out_name in slice_names]
+
+    def export_repo(out_name: str) -> tuple[str, dict | None, str | None]:
+        entry, reason = bundle_repo(Path(report.out_dir) / out_name, export_dir / f'{out_name}.bundle')
+        return out_name, entry, reason
+
+    # bundling is mostly pack compression, one process per core
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        results = list(executor.map(export_repo, out_names))
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'assignment': report.assignment_name,
+        'due_date': report.due_date,
+        'due_time': report.due_time,
+        'clone_source': report.clone_source,
+        'exported': datetime.now().isoformat(timespec='seconds'),
+        'repos': [entry for _, entry, _ in results if entry is not None],
+        'skipped': [{'name': out_name, 'reason': reason} for out_name, entry, reason in results if entry is None],
+    }
+    with open(export_dir / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_bundles(bundle_dir: Path | str, out_dir: Path | str) -> tuple[list[str], list[tuple[str, str]]]:
+    """
+    Clone every bundle listed in bundle_dir's manifest into out_dir, no network access is needed.
+    Returns the names of the repos loaded and (name, reason) for the ones that were not.
+    """
+    bundle_dir = Path(bundle_dir)
+    out_dir = Path(out_dir)
+    with open(bundle_dir / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    def load_repo(entry: dict) -> tuple[str, str | None]:
+        if not isinstance(entry, dict) or not is_plain_name(entry.get('name', None)) or not is_plain_name(entry.get('bundle', None)):
+            return str(entry.get('name', None) if isinstance(entry, dict) else entry), 'invalid manifest entry, name and bundle must be plain file names'
+        bundle_path = bundle_dir / entry['bundle']
+        if not bundle_path.exists():
+            return entry['name'], 'bundle file is missing'
+        if file_sha256(bundle_path) != entry.get('sha256', None):
+            return entry['name'], 'bundle file is corrupt'
+        repo_path = out_dir / entry['name']
+        if repo_path.exists():
+            shutil.rmtree(repo_path, onexc=onerror)
+        _, stderr, exitcode = run_cmd(['git', '-c', 'advice.detachedHead=false', 'clone', '-q', str(bundle_path.absolute()), entry['name']], cwd=out_dir)
+        if exitcode != 0:
+            return entry['name'], stderr or 'git clone failed'
+        run_cmd(['git', 'remote', 'remove', 'origin'], cwd=repo_path)  # the bundle is only where it came from on this machine
+        return entry['name'], None
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        results = list(executor.map(load_repo, manifest.get('repos', [])))
+    return [name for name, reason in results if reason is None], [(name, reason) for name, reason in results if reason is not None]
@@ -1,5 +1,8 @@
+from .bundle_export import export_bundles
 from .clone_report import CloneReport
+from .source_api_client import RESUMABLE_CLONED_STATUSES, RESUMABLE_DONE_STATUSES, main
 
+from utils import bool_prompt
 from tuiframeworkpy import SubMenu, Event, MenuOption
 from tuiframeworkpy import LIGHT_RED, LIGHT_GREEN, CYAN, WHITE, clear
 
@@ -59,8 +62,14 @@ class CloneHistoryMenu(SubMenu):
             for line in report.outputs_log:
                 report_str += f'{line}\n'
 
-            def on_select(bound_report_str=report_str):
+            def on_select(bound_report_str=report_str, bound_report=report):
                 print(bound_report_str)
+                failed_repos = get_failed_repos(bound_report)
+                if failed_repos and bool_prompt(f'Retry the {len(failed_repos)} failed repos ({", ".join(failed_repos)})?', False):
+                    main(None, False, self.context.config_manager, retry_report=bound_report)
+                    self.load()
+                elif get_cloned_repos(bound_report) and bool_prompt('Export git bundles of the cloned repos for offline grading?', False):
+                    export_report_bundles(bound_report)
                 input('Press enter to continue...')
                 clear()
 
@@ -82,3 +91,35 @@ def report_summary(report):
     due_str = f'{report.due_date} {report.due_time}'.ljust(20)
     curr_str = f'{report.current_date} {report.current_time}'.ljust(20)
     return f'{CYAN}{assignment_tag_str}{LIGHT_GREEN}{due_str}{LIGHT_RED}{curr_str}{WHITE}'
+
+
+def get_cloned_repos(report) -> list[str]:
+    """
+    Names of the repos a run finished cloning, reports from dry runs or older versions have none
+    """
+    if getattr(report, 'dry_run', False) or not getattr(report, 'out_dir', ''):
+        return []
+    return [out_name for out_name, status, *_ in getattr(report, 'repo_outcomes', ()) if status in RESUMABLE_CLONED_STATUSES]
+
+
+def export_report_bundles(report) -> None:
+    default_export_dir = f'{report.out_dir}_bundles'
+    export_dir = input(f'Folder to export the bundles to (enter for {default_export_dir}): ').strip().strip('"\'') or default_export_dir
+    students_csv = input("Students csv of a grader's slice of the class (enter for every repo): ").strip().strip('"\'')
+    try:
+        manifest = export_bundles(report, export_dir, students_csv or None)
+    except Exception as e:
+        print(f'{LIGHT_RED}Unable to export bundles: {e!r}{WHITE}')
+        return
+    print(f'{CYAN}[INFO]: Exported {len(manifest["repos"])} bundles and a manifest to {export_dir}.{WHITE}')
+    for skipped in manifest['skipped']:
+        print(f'{LIGHT_RED}  > {skipped["name"]}: {skipped["reason"]}{WHITE}')
+
+
+def get_failed_repos(report) -> list[str]:
+    """
+    Names of the repos that did not finish in a run, reports from dry runs or older versions have none to retry
+    """
+    if getattr(report, 'dry_run', False) or not getattr(report, 'out_dir', ''):
+        return []
+    return [out_name for out_name, status, *_ in getattr(report, 'repo_outcomes', ()) if status not in RESUMABLE_DONE_STATUSES]
@@ -2,12 +2,14 @@ import asyncio
 import shutil
 import os
 
+from .batch_clone import run_batch
+from .bundle_export import load_bundles
 from .clone_preset import ClonePreset
 from .source_api_client import main
 
 from utils import get_color_from_bool, async_run_cmd, list_to_multi_clone_presets, onerror
 from tuiframeworkpy import SubMenu, Event, MenuOption
-from tuiframeworkpy import LIGHT_RED, LIGHT_GREEN, WHITE
+from tuiframeworkpy import LIGHT_RED, LIGHT_GREEN, CYAN, WHITE
 
 # Get computer's current UTC offset
 # Then get the inverse so that when due date/time is input in local time, it will be processed as UTC
@@ -51,6 +53,16 @@ class CloneMenu(SubMenu):
         clone_repos = MenuOption(4, 'Continue Without Preset', clone_repos_event, Event(), Event())
         self.local_options.append(clone_repos)
 
+        bulk_clone_event = Event()
+        bulk_clone_event += self.bulk_clone
+        bulk_clone = MenuOption(5, 'Bulk Clone From File', bulk_clone_event, Event(), Event())
+        self.local_options.append(bulk_clone)
+
+        load_bundles_event = Event()
+        load_bundles_event += self.load_bundles
+        load_bundles_option = MenuOption(6, 'Load Exported Bundles', load_bundles_event, Event(), Event())
+        self.local_options.append(load_bundles_option)
+
         SubMenu.__init__(
             self,
             id,
@@ -92,6 +104,27 @@ class CloneMenu(SubMenu):
         dry_run = bool(self.dry_run)
         main(preset, dry_run, self.context.config_manager)
 
+    def bulk_clone(self):
+        print('Batch file rows need the columns: preset, prefix, due_date, due_time (preset and due_time may be empty).')
+        batch_path = input('Path to batch csv/json file: ').strip().strip('"\'')
+        if not batch_path:
+            return
+        run_batch(batch_path, bool(self.dry_run), self.context.config_manager)
+
+    def load_bundles(self):
+        bundle_dir = input('Path to the exported bundles folder: ').strip().strip('"\'')
+        if not bundle_dir:
+            return
+        default_out_dir = os.path.join(self.context.config_manager.config.out_dir, os.path.basename(os.path.normpath(bundle_dir)))
+        out_dir = input(f'Folder to load them into (enter for {default_out_dir}): ').strip().strip('"\'') or default_out_dir
+        try:
+            loaded, failed = load_bundles(bundle_dir, out_dir)
+        except (OSError, ValueError, KeyError) as e:
+            print(f'{LIGHT_RED}Unable to load bundles: {e!r}{WHITE}')
+            return
+        print(f'{CYAN}[INFO]: Loaded {len(loaded)} repos into {out_dir}.{WHITE}')
+        for name, reason in failed:
+            print(f'{LIGHT_RED}  > {name}: {reason}{WHITE}')
 
     def build_preset_options(self) -> list:
         options = []
@@ -1,4 +1,7 @@
 # preset consists of output file suffix, clone time, prefix name, csv file or default
+CLONE_STRATEGIES = ['Full', 'Shallow', 'Blobless', 'Archive']
+
+
 class ClonePreset:
     __slots__ = [
         'folder_suffix',
@@ -8,6 +11,11 @@ class ClonePreset:
         'append_timestamp',
         'clone_type',
         'clone_source',
+        'clone_strategy',
+        'size_limit',
+        'blob_limit',
+        'extra_deadlines',
+        'sparse_paths',
     ]
 
     def __init__(
@@ -18,7 +26,12 @@ class ClonePreset:
         csv_path,
         append_timestamp,
         clone_type: tuple[int, int, int],
-        clone_source
+        clone_source,
+        clone_strategy: str = 'Full',
+        size_limit: int = 0,
+        blob_limit: int = 0,
+        extra_deadlines: list[int] = None,
+        sparse_paths: list[str] = None,
     ):
         self.name = name
         self.folder_suffix = folder_suffix
@@ -27,9 +40,14 @@ class ClonePreset:
         self.append_timestamp = append_timestamp
         self.clone_type = clone_type
         self.clone_source = clone_source
+        self.clone_strategy = clone_strategy
+        self.size_limit = size_limit  # MB, repos over it are flagged in the report, 0 for no limit
+        self.blob_limit = blob_limit  # MB, files over it are left out of flagged repos, 0 to clone them whole
+        self.extra_deadlines = list(extra_deadlines or [])  # hours after the due time to also snapshot each repo at
+        self.sparse_paths = list(sparse_paths or [])  # folders to check out, files outside them are never downloaded, empty for the whole repo
 
     def __repr__(self) -> str:
-        return f'ClonePreset(folder_suffix: {self.folder_suffix}, clone_time: {self.clone_time}, name: {self.name}, csv_path: {self.csv_path}, append_timestamp: {self.append_timestamp}, clone_source: {self.clone_source})'
+        return f'ClonePreset(folder_suffix: {self.folder_suffix}, clone_time: {self.clone_time}, name: {self.name}, csv_path: {self.csv_path}, append_timestamp: {self.append_timestamp}, clone_source: {self.clone_source}, clone_strategy: {self.clone_strategy}, size_limit: {self.size_limit}, blob_limit: {self.blob_limit}, extra_deadlines: {self.extra_deadlines}, sparse_paths: {self.sparse_paths})'
 
     def __eq__(self, other) -> bool:
         if not isinstance(other, ClonePreset):
@@ -21,3 +21,14 @@ class CloneReport:
     dry_run: str = ''
     student_csv: str = ''
     outputs_log: tuple = ()
+    out_dir: str = ''
+    clone_source: str = ''
+    clone_strategy: str = ''
+    clone_type: tuple = ()
+    current_pull: bool = False
+    repo_outcomes: tuple = ()  # (out_name, status name, commit hash, late deadline commits, late deadline paths) per repo
+    size_limit: int = 0
+    blob_limit: int = 0
+    extra_deadlines: tuple = ()  # hours after the due datetime
+    snapshot_dirs: tuple = ()  # output folder of each extra deadline
+    sparse_paths: tuple = ()  # folders checked out, empty for the whole repo
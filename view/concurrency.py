@@ -0,0 +1,136 @@
+import asyncio
+
+from threading import Condition
+from time import perf_counter
+
+NETWORK_GIT_COMMANDS = ('clone', 'fetch')
+TRANSIENT_GIT_ERRORS = ('429', 'rate limit', 'timed out', 'connection reset', 'early eof', 'rpc failed', 'could not resolve host', 'unable to access')
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit shared by every thread or coroutine doing one kind of work.
+    The limit grows by one slot per `limit` successful calls while latency stays within
+    `latency_tolerance` of the best seen, and halves when calls are throttled or fail transiently.
+    """
+
+    def __init__(self, name: str, initial: int, min_limit: int = 1, max_limit: int = 64, latency_tolerance: float = 2.0, backoff_interval: float = 1.0) -> None:
+        self.name = name
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.limit = float(min(self.max_limit, max(self.min_limit, int(initial))))
+        self.latency_tolerance = latency_tolerance
+        self.backoff_interval = backoff_interval
+
+        self.in_flight = 0
+        self.peak_limit = self.current
+        self.lowest_limit = self.current
+        self.num_calls = 0
+        self.num_throttled = 0
+        self.num_errors = 0
+        self.best_latency = None
+        self.avg_latency = None
+        self.last_decrease = 0.0
+        self.condition = Condition()
+        self.async_waiters = []  # (event loop, future) of coroutines waiting for a slot, woken by release
+
+    @property
+    def current(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def try_acquire(self) -> bool:
+        with self.condition:
+            if self.in_flight >= self.current:
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self) -> None:
+        with self.condition:
+            while self.in_flight >= self.current:
+                self.condition.wait()
+            self.in_flight += 1
+
+    async def async_acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                if self.in_flight < self.current:
+                    self.in_flight += 1
+                    return
+                # registered under the lock, a release between the check and the await still wakes this waiter
+                waiter = loop.create_future()
+                self.async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, latency: float, ok: bool = True, throttled: bool = False) -> None:
+        with self.condition:
+            self.in_flight -= 1
+            self.num_calls += 1
+            if throttled or not ok:
+                if throttled:
+                    self.num_throttled += 1
+                else:
+                    self.num_errors += 1
+                # only back off once per interval, a burst of failures from one congestion event should not collapse the limit
+                now = perf_counter()
+                if now - self.last_decrease >= self.backoff_interval:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self.last_decrease = now
+                    self.lowest_limit = min(self.lowest_limit, self.current)
+            else:
+                self.best_latency = latency if self.best_latency is None else min(self.best_latency, latency)
+                self.avg_latency = latency if self.avg_latency is None else (self.avg_latency * 0.8) + (latency * 0.2)
+                if self.avg_latency <= self.best_latency * self.latency_tolerance:
+                    self.limit = min(self.max_limit, self.limit + (1 / self.limit))
+                    self.peak_limit = max(self.peak_limit, self.current)
+            async_waiters = self.__notify()
+        wake_async_waiters(async_waiters)
+
+    def release_slot(self) -> None:
+        """
+        Give a slot back without counting the call, for work that was stopped rather than finished (a hedge that lost)
+        """
+        with self.condition:
+            self.in_flight -= 1
+            async_waiters = self.__notify()
+        wake_async_waiters(async_waiters)
+
+    def __notify(self) -> list:
+        # called holding the condition, coroutines are woken on their own loop once it is released
+        self.condition.notify_all()
+        async_waiters, self.async_waiters = self.async_waiters, []
+        return async_waiters
+
+    def summary(self) -> str:
+        avg_latency = f'{round(self.avg_latency, 2)}s' if self.avg_latency is not None else 'n/a'
+        return f'{self.name}: limit {self.current} (peak {self.peak_limit}, low {self.lowest_limit}), {self.num_calls} calls, {self.num_throttled} throttled, {self.num_errors} errors, avg latency {avg_latency}'
+
+
+def wake_async_waiters(async_waiters: list) -> None:
+    for loop, waiter in async_waiters:
+        try:
+            loop.call_soon_threadsafe(wake_waiter, waiter)
+        except RuntimeError:
+            pass  # the loop of a cancelled run is already closed
+
+
+def wake_waiter(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def is_network_git_cmd(cmd: list) -> bool:
+    return len(cmd) > 1 and cmd[0] == 'git' and cmd[1] in NETWORK_GIT_COMMANDS
+
+
+def release_git_limiter(limiter: AdaptiveLimiter, latency: float, result: tuple | None) -> None:
+    """
+    Report a finished git command to the limiter. Only transient network failures count against it,
+    a deterministic failure (bad ref, missing repo) says nothing about how much concurrency the link can take.
+    """
+    stderr = (result[1] or '').lower() if result is not None else ''
+    failed = result is None or result[2] != 0
+    transient = failed and (result is None or any(err in stderr for err in TRANSIENT_GIT_ERRORS))
+    throttled = transient and ('429' in stderr or 'rate limit' in stderr)
+    limiter.release(latency, ok=not transient, throttled=throttled)
@@ -10,7 +10,8 @@ from tuiframeworkpy import (
     WHITE,
     clear,
 )
-from utils import list_to_multi_clone_presets, check_time, bool_prompt
+from .clone_preset import CLONE_STRATEGIES
+from utils import list_to_multi_clone_presets, check_time, bool_prompt, folders_list_prompt, hours_list_prompt, megabytes_prompt
 
 # TODO: maybe extract run method and config entry view menu into class for TUIFrameworkPy
 
@@ -20,6 +21,10 @@ PROMPT_INDEX_TEXT = {
     2: 'Enter new preset clone time: ',
     3: 'Enter new preset students csv path: ',
     4: 'Would you like to append timestamp to the file suffix?',
+    8: 'Flag repos larger than how many MB (enter for no limit)? ',
+    9: 'Leave files larger than how many MB out of flagged repos (enter to clone them whole)? ',
+    10: 'Late deadlines to also snapshot, hours after the clone time separated by commas (e.g. 24,48, enter for none): ',
+    11: 'Folders to check out, separated by commas (e.g. src/part2, enter for the whole repo): ',
 }
 
 
@@ -89,9 +94,69 @@ class EditPresetMenu(SubMenu):
         )
         self.local_options.append(change_source)
 
+        change_strategy_event = Event()
+        change_strategy_event += lambda: self.edit_config_value(7)
+        change_strategy = MenuOption(
+            7,
+            f'Clone Strategy: {self.preset[7]}',
+            change_strategy_event,
+            Event(),
+            Event(),
+            False,
+        )
+        self.local_options.append(change_strategy)
+
+        edit_size_limit_event = Event()
+        edit_size_limit_event += lambda: self.edit_config_value(8)
+        edit_size_limit = MenuOption(
+            8,
+            f'Size Limit (MB): {self.preset[8]}',
+            edit_size_limit_event,
+            Event(),
+            Event(),
+            False,
+        )
+        self.local_options.append(edit_size_limit)
+
+        edit_blob_limit_event = Event()
+        edit_blob_limit_event += lambda: self.edit_config_value(9)
+        edit_blob_limit = MenuOption(
+            9,
+            f'Blob Limit (MB): {self.preset[9]}',
+            edit_blob_limit_event,
+            Event(),
+            Event(),
+            False,
+        )
+        self.local_options.append(edit_blob_limit)
+
+        edit_deadlines_event = Event()
+        edit_deadlines_event += lambda: self.edit_config_value(10)
+        edit_deadlines = MenuOption(
+            10,
+            f'Late Deadlines (hours): {self.preset[10]}',
+            edit_deadlines_event,
+            Event(),
+            Event(),
+            False,
+        )
+        self.local_options.append(edit_deadlines)
+
+        edit_sparse_paths_event = Event()
+        edit_sparse_paths_event += lambda: self.edit_config_value(11)
+        edit_sparse_paths = MenuOption(
+            11,
+            f'Sparse Folders: {self.preset[11]}',
+            edit_sparse_paths_event,
+            Event(),
+            Event(),
+            False,
+        )
+        self.local_options.append(edit_sparse_paths)
+
         delete_preset_event = Event()
         delete_preset_event += self.delete_preset
-        delete_preset = MenuOption(7, 'Delete Preset', delete_preset_event, Event(), Event(), False)
+        delete_preset = MenuOption(12, 'Delete Preset', delete_preset_event, Event(), Event(), False)
         self.local_options.append(delete_preset)
 
         edit_name.on_exit += self.load
@@ -99,6 +164,10 @@ class EditPresetMenu(SubMenu):
         edit_time.on_exit += self.load
         edit_csv.on_exit += self.load
         edit_app_time.on_exit += self.load
+        edit_size_limit.on_exit += self.load
+        edit_blob_limit.on_exit += self.load
+        edit_deadlines.on_exit += self.load
+        edit_sparse_paths.on_exit += self.load
 
         SubMenu.__init__(
             self,
@@ -126,6 +195,16 @@ class EditPresetMenu(SubMenu):
                 option.text = f'Append Time: {self.preset[i]}'
             elif option.text.startswith('Clone Source'):
                 option.text = f'Clone Source: {self.preset[6]}'
+            elif option.text.startswith('Clone Strategy'):
+                option.text = f'Clone Strategy: {self.preset[7]}'
+            elif option.text.startswith('Size Limit'):
+                option.text = f'Size Limit (MB): {self.preset[8]}'
+            elif option.text.startswith('Blob Limit'):
+                option.text = f'Blob Limit (MB): {self.preset[9]}'
+            elif option.text.startswith('Late Deadlines'):
+                option.text = f'Late Deadlines (hours): {self.preset[10]}'
+            elif option.text.startswith('Sparse Folders'):
+                option.text = f'Sparse Folders: {self.preset[11]}'
         self.invalid_input_string = f'You entered an invalid option.\n\nPlease enter a number between {self.min_options} and {self.max_options}.\nPress enter to try again.'
 
     def run(self):
@@ -133,7 +212,7 @@ class EditPresetMenu(SubMenu):
         while handle_option_return[0]:
             user_input = self.get_option()
             handle_option_return = self.handle_option(user_input)
-            if user_input.lower() == '6':
+            if user_input.lower() == '12':
                 break
         clear()
 
@@ -146,8 +225,17 @@ class EditPresetMenu(SubMenu):
         prompt = PROMPT_INDEX_TEXT[value_index] if value_index in PROMPT_INDEX_TEXT else 'Enter new value: '
         if value_index == 6:
             new_value = 'GitHub' if self.preset[6] == 'GitLab' else 'GitLab'
+        elif value_index == 7:
+            next_index = (CLONE_STRATEGIES.index(self.preset[7]) + 1) if self.preset[7] in CLONE_STRATEGIES else 0
+            new_value = CLONE_STRATEGIES[next_index % len(CLONE_STRATEGIES)]
         elif value_index == 4:
             new_value = bool_prompt(prompt, False)
+        elif value_index in (8, 9):
+            new_value = megabytes_prompt(prompt)
+        elif value_index == 10:
+            new_value = hours_list_prompt(prompt)
+        elif value_index == 11:
+            new_value = folders_list_prompt(prompt)
         else:
             new_value = input(prompt)
 
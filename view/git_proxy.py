@@ -0,0 +1,204 @@
+import gzip
+import os
+import secrets
+import shutil
+import subprocess
+
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Lock, Thread
+from time import time
+
+from .mirror_cache import MirrorCache
+
+DEFAULT_REFRESH_SECONDS = 300
+
+
+def pkt_line(data: str) -> bytes:
+    return f'{len(data) + 4:04x}{data}'.encode()
+
+
+class GitCacheProxy:
+    """
+    Local smart HTTP git server answering clones and fetches (git-upload-pack) from a MirrorCache.
+    A mirror is refreshed from upstream at most once per refresh_seconds, tracked on disk, so TAs sharing the mirror folder
+    on a lab server also share the refreshes, and a deadline's worth of clones reaches GitHub or GitLab once per repo.
+    Upstream urls (and their tokens) are only held in memory and served under a random path, only registered repos are served.
+    """
+
+    def __init__(self, mirror_cache: MirrorCache = None, refresh_seconds: float = DEFAULT_REFRESH_SECONDS, host: str = '127.0.0.1', port: int = 0) -> None:
+        self.mirror_cache = mirror_cache if mirror_cache is not None else MirrorCache()
+        self.refresh_seconds = refresh_seconds
+        self.host = host
+        self.port = port
+        self.secret = secrets.token_urlsafe(16)
+        self.upstreams = {}  # mirror key -> (authenticated upstream url, unix time the mirror must be newer than, default branch)
+        self.server = None
+        self.thread = None
+        self.num_served = 0
+        self.num_refreshes = 0
+        self.num_refresh_errors = 0
+        self.lock = Lock()
+
+    def start(self) -> None:
+        proxy = self
+
+        class Handler(GitProxyRequestHandler):
+            pass
+
+        Handler.proxy = proxy
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = Thread(target=self.server.serve_forever, name='git-cache-proxy', daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def register(self, clone_url: str, fresh_after: datetime = None, default_branch: str = None) -> str:
+        """
+        Url to clone clone_url through the proxy. With fresh_after (UTC) a mirror last refreshed before it is refreshed regardless of the interval,
+        so a mirror refreshed before a deadline is never used to find a commit pushed right before it.
+        A fresh_after still in the future only asks for a refresh since now, nothing pushed later can be fetched yet anyway.
+        default_branch is what a clone through the proxy checks out, mirrors do not know the upstream HEAD.
+        """
+        key = self.mirror_cache.mirror_path(clone_url).stem
+        if fresh_after is not None and fresh_after.tzinfo is None:
+            fresh_after = fresh_after.replace(tzinfo=timezone.utc)
+        with self.lock:
+            self.upstreams[key] = (clone_url, min(fresh_after.timestamp(), time()) if fresh_after is not None else 0, default_branch)
+        return f'http://{self.host}:{self.port}/{self.secret}/{key}.git'
+
+    def refresh_stamp(self, key: str) -> Path:
+        return self.mirror_cache.root / f'{key}.refreshed'
+
+    def mirror_for(self, key: str) -> Path | None:
+        """
+        Path of the mirror for key, refreshed from upstream first if it is stale. None if key was never registered.
+        """
+        with self.lock:
+            upstream = self.upstreams.get(key, None)
+        if upstream is None:
+            return None
+        clone_url, fresh_after, default_branch = upstream
+        stamp = self.refresh_stamp(key)
+        with self.mirror_cache.lock(clone_url):
+            refreshed_at = stamp.stat().st_mtime if stamp.exists() else 0
+            mirror_path = self.mirror_cache.mirror_path(clone_url)
+            if refreshed_at < fresh_after or time() - refreshed_at >= self.refresh_seconds or not (mirror_path / 'HEAD').exists():
+                mirror_path, result = self.mirror_cache.update(clone_url)
+                with self.lock:
+                    self.num_refreshes += 1
+                    self.num_refresh_errors += int(result[2] != 0)
+                if result[2] == 0:
+                    stamp.touch()
+                elif not (mirror_path / 'HEAD').exists():
+                    return None
+            head_ref = f'ref: refs/heads/{default_branch}'
+            if default_branch and (mirror_path / 'HEAD').read_text().strip() != head_ref:
+                self.mirror_cache.run_git(['git', 'symbolic-ref', 'HEAD', f'refs/heads/{default_branch}'], cwd=mirror_path)
+        with self.lock:
+            self.num_served += 1
+        return mirror_path
+
+    def summary(self) -> str:
+        return f'Git proxy: {self.num_served} requests served from local mirrors, {self.num_refreshes} upstream refreshes ({self.num_refresh_errors} failed)'
+
+
+class GitProxyRequestHandler(BaseHTTPRequestHandler):
+    """
+    The upload-pack half of git's smart HTTP protocol (what `git http-backend` does for fetches), for protocol v0 and v2.
+    """
+
+    proxy: GitCacheProxy = None
+
+    def log_message(self, format, *args) -> None:
+        pass  # keep the clone status screen clean
+
+    def resolve(self, suffix: str) -> Path | None:
+        path = self.path.split('?', 1)[0]
+        prefix = f'/{self.proxy.secret}/'
+        if not path.startswith(prefix) or not path.endswith(suffix):
+            self.send_error(404)
+            return None
+        mirror_path = self.proxy.mirror_for(path[len(prefix) : -len(suffix)].removesuffix('.git'))
+        if mirror_path is None:
+            self.send_error(404)
+        return mirror_path
+
+    def git_env(self) -> dict:
+        env = dict(os.environ)
+        git_protocol = self.headers.get('Git-Protocol', None)
+        if git_protocol:
+            env['GIT_PROTOCOL'] = git_protocol
+        return env
+
+    def do_GET(self) -> None:
+        if 'service=git-upload-pack' not in self.path:
+            self.send_error(403, 'only fetching is supported')
+            return
+        mirror_path = self.resolve('/info/refs')
+        if mirror_path is None:
+            return
+        env = self.git_env()
+        result = subprocess.run(['git', 'upload-pack', '--stateless-rpc', '--advertise-refs', str(mirror_path)], capture_output=True, env=env)
+        if result.returncode != 0:
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-git-upload-pack-advertisement')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        if 'version=2' not in env.get('GIT_PROTOCOL', ''):
+            self.wfile.write(pkt_line('# service=git-upload-pack\n') + b'0000')
+        self.wfile.write(result.stdout)
+
+    def read_body(self) -> bytes:
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';', 1)[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            body = b''.join(chunks)
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding', '').lower() in ('gzip', 'x-gzip'):
+            body = gzip.decompress(body)
+        return body
+
+    def do_POST(self) -> None:
+        mirror_path = self.resolve('/git-upload-pack')
+        if mirror_path is None:
+            return
+        body = self.read_body()
+        proc = subprocess.Popen(['git', 'upload-pack', '--stateless-rpc', str(mirror_path)], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=self.git_env())
+
+        def write_request() -> None:
+            try:
+                proc.stdin.write(body)
+                proc.stdin.close()
+            except OSError:
+                pass  # upload-pack stopped reading, its exit code is all that matters
+
+        # the pack is streamed as upload-pack writes it, a large repo is never held in memory
+        writer = Thread(target=write_request, daemon=True)
+        writer.start()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-git-upload-pack-result')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            shutil.copyfileobj(proc.stdout, self.wfile)
+        finally:
+            writer.join()
+            proc.stdout.close()
+            proc.wait()
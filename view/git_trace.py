@@ -0,0 +1,108 @@
+import json
+import os
+import re
+
+from itertools import count
+from pathlib import Path
+
+from .concurrency import is_network_git_cmd
+
+PHASES = ('negotiation', 'receive', 'index', 'checkout')
+PHASE_NAMES = {'negotiation': 'negotiation', 'receive': 'pack receive', 'index': 'index-pack', 'checkout': 'checkout'}
+RECEIVE_REGIONS = ('Receiving objects', 'Unpacking objects')
+PROGRESS_LINE_REGEX = re.compile(r'^(remote: )?([\w ]+: +\d+% \(\d+/\d+\)|[\w ]+: +\d+, done\.|Total \d+ )')
+
+trace_ids = count()
+
+
+class GitTrace:
+    """
+    Where the time of the git commands run for one repo went, read from git's trace2 event stream (GIT_TRACE2_EVENT).
+    Each command writes to its own event file, parsed and removed as soon as the command exits.
+    Git only emits its receive and delta resolution regions while it shows progress, so traced clones and fetches
+    swap -q for --progress and the progress lines are dropped from their stderr again. Traced fetches keep every pack
+    (fetch.unpackLimit=1), small packs would otherwise be unpacked by unpack-objects, which never shows progress to a pipe.
+    """
+
+    def __init__(self, trace_dir: Path | str) -> None:
+        self.trace_dir = Path(trace_dir)
+        self.trace_id = next(trace_ids)
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.bytes_received = 0
+        self.num_commands = 0
+        self.event_path = None
+
+    def wrap(self, cmd: list, env: dict = None) -> tuple[list, dict]:
+        """
+        Command and environment (env, or this process's if not given) that run cmd with an event file of its own
+        """
+        self.event_path = self.trace_dir / f'{self.trace_id}-{self.num_commands}.json'
+        self.num_commands += 1
+        env = dict(env if env is not None else os.environ, GIT_TRACE2_EVENT=str(self.event_path))
+        if is_network_git_cmd(cmd):
+            cmd = cmd[:2] + ['--progress'] + [arg for arg in cmd[2:] if arg != '-q']
+            env.update(GIT_CONFIG_COUNT='1', GIT_CONFIG_KEY_0='fetch.unpackLimit', GIT_CONFIG_VALUE_0='1')
+        return cmd, env
+
+    def collect(self, cmd: list, result: tuple[str | None, str | None, int]) -> tuple[str | None, str | None, int]:
+        """
+        Add the phases of the command wrap was last called for, returns its result with the progress lines removed
+        """
+        event_path, self.event_path = self.event_path, None
+        if event_path is None or not event_path.exists():
+            return result
+        try:
+            with open(event_path, 'r', encoding='utf-8', errors='replace') as f:
+                self.add_events(cmd, f)
+        finally:
+            event_path.unlink(missing_ok=True)
+        stdout, stderr, exitcode = result
+        if stderr and is_network_git_cmd(cmd):
+            lines = [line for line in re.split(r'[\r\n]+', stderr) if line and not PROGRESS_LINE_REGEX.match(line)]
+            stderr = '\n'.join(lines) or None
+        return stdout, stderr, exitcode
+
+    def add_events(self, cmd: list, lines) -> None:
+        # a hedged clone writes to the same file, only the process tree started for cmd itself is counted
+        roots = set()
+        progress_labels = {}
+        for line in lines:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue  # a process killed mid write
+            sid = event.get('sid', '')
+            root = sid.split('/', 1)[0]
+            kind = event.get('event')
+            if kind == 'start' and '/' not in sid and event.get('argv', [])[-1:] == cmd[-1:]:
+                roots.add(root)
+            if root not in roots:
+                continue
+            category = event.get('category')
+            label = event.get('label', '')
+            if kind == 'region_enter' and category == 'progress':
+                progress_labels[sid] = label
+            elif kind == 'region_leave' and category == 'fetch-pack' and label.startswith('negotiation'):
+                self.seconds['negotiation'] += event.get('t_rel', 0)
+            elif kind == 'region_leave' and category == 'progress' and label in RECEIVE_REGIONS:
+                self.seconds['receive'] += event.get('t_rel', 0)
+            elif kind == 'region_leave' and category == 'progress' and label == 'Resolving deltas':
+                self.seconds['index'] += event.get('t_rel', 0)
+            elif kind == 'region_leave' and category == 'unpack_trees' and label == 'unpack_trees':
+                self.seconds['checkout'] += event.get('t_rel', 0)
+            elif kind == 'data' and category == 'progress' and event.get('key') == 'total_bytes' and progress_labels.get(sid) in RECEIVE_REGIONS:
+                self.bytes_received += int(event.get('value', 0))
+
+
+def trace_summary(traces: list[GitTrace]) -> str:
+    """
+    Time spent in each phase summed over traces, which phase the run was bound by and the pack download rate
+    """
+    seconds = {phase: sum(trace.seconds[phase] for trace in traces) for phase in PHASES}
+    bytes_received = sum(trace.bytes_received for trace in traces)
+    phases_str = ', '.join(f'{PHASE_NAMES[phase]} {round(seconds[phase], 2)}s' for phase in PHASES)
+    mb_received = bytes_received / 1024 / 1024
+    rate_str = f' ({round(mb_received / seconds["receive"], 2)}MB/s)' if seconds['receive'] else ''
+    slowest = max(PHASES, key=seconds.get)
+    bound_str = {'negotiation': 'network round trips', 'receive': 'network bandwidth', 'index': 'CPU', 'checkout': 'disk'}[slowest] if seconds[slowest] else 'nothing'
+    return f'Git phases over {len(traces)} repos: {phases_str}, {round(mb_received, 2)}MB received{rate_str}, mostly bound by {bound_str}'
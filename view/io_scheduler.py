@@ -0,0 +1,148 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from itertools import count
+from queue import PriorityQueue
+from threading import Lock, Thread
+
+from .concurrency import AdaptiveLimiter
+
+STOP = object()
+
+# lower runs first: pages of a listing a task is already waiting on, then fan outs over repos, then pipeline stages (`Pipeline` orders those)
+PRIORITY_PAGE = 0
+PRIORITY_REPO = 1
+PRIORITY_STAGE = 2
+
+
+class IOScheduler:
+    """
+    The one bounded pool of threads a run does its blocking I/O on, owned by the API client (shared by a batch).
+    Pipeline stages, fan outs over repos and page requests all run on it, taken lowest priority first, as Futures that can be cancelled until they start.
+    A thread is only started when a task is waiting and no thread is idle, never more than max_workers however many assignments share it.
+    It also holds the run's limits on git processes next to the client's limit on API requests, so every stage draws from the same budget.
+    Work can be submitted from work already running on it, a caller waiting on results runs its own queued tasks itself
+    instead of waiting for a worker, so nested fan outs never deadlock and never add threads.
+    """
+
+    def __init__(self, name: str, max_workers: int, git_limiter: AdaptiveLimiter = None, checkout_limiter: AdaptiveLimiter = None) -> None:
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.git_limiter = git_limiter
+        self.checkout_limiter = checkout_limiter
+        self.queue = PriorityQueue()
+        self.tasks = {}  # future -> (func, args) until a worker or a waiting caller claims it
+        self.order = count()  # breaks priority ties in submission order
+        self.threads = []
+        self.num_idle = 0  # workers waiting for a task that no submitted task has been handed to yet
+        self.num_tasks = 0
+        self.num_helped = 0
+        self.num_cancelled = 0
+        self.closed = False
+        self.lock = Lock()
+
+    def submit(self, func, *args, priority: int = PRIORITY_REPO) -> Future:
+        future = Future()
+        thread = None
+        with self.lock:
+            if self.closed:
+                future.cancel()
+                return future
+            self.num_tasks += 1
+            self.tasks[future] = (func, args)
+            if self.num_idle > 0:
+                self.num_idle -= 1
+            elif len(self.threads) < self.max_workers:
+                thread = Thread(target=self.__work, name=f'{self.name}-{len(self.threads)}', daemon=True)
+                self.threads.append(thread)
+        self.queue.put((priority, next(self.order), future))
+        if thread is not None:
+            thread.start()
+        return future
+
+    def map_unordered(self, func, items, priority: int = PRIORITY_REPO):
+        """
+        Yield func(item) for every item as the calls finish. Calls not started yet are cancelled if the caller stops iterating.
+        """
+        futures = [self.submit(func, item, priority=priority) for item in items]
+        try:
+            for future in self.as_completed(futures):
+                yield future.result()
+        finally:
+            self.cancel(futures)
+
+    def as_completed(self, futures: list[Future]):
+        """
+        Yield futures as they finish. While none is done the caller runs one of them that is still queued,
+        it blocks until one finishes only once workers have started all of them.
+        """
+        pending = set(futures)
+        unclaimed = deque(futures)
+        while pending:
+            if not any(future.done() for future in pending) and not self.__help(unclaimed):
+                wait(pending, return_when=FIRST_COMPLETED)
+            done = {future for future in pending if future.done()}
+            pending -= done
+            yield from done
+
+    def cancel(self, futures: list[Future]) -> None:
+        with self.lock:
+            for future in futures:
+                if future in self.tasks and future.cancel():
+                    del self.tasks[future]
+                    self.num_cancelled += 1
+
+    def cancel_pending(self) -> None:
+        """
+        Cancel everything that has not started yet, work already running finishes
+        """
+        with self.lock:
+            futures = list(self.tasks)
+        self.cancel(futures)
+
+    def close(self) -> None:
+        with self.lock:
+            self.closed = True
+            threads = list(self.threads)
+        self.cancel_pending()
+        for _ in threads:
+            self.queue.put((float('inf'), next(self.order), STOP))
+
+    def summary(self) -> str:
+        return f'I/O scheduler: {len(self.threads)}/{self.max_workers} threads, {self.num_tasks} tasks, {self.num_helped} run by waiting callers, {self.num_cancelled} cancelled'
+
+    def __help(self, unclaimed: deque) -> bool:
+        """
+        Run the first task of unclaimed nobody has started yet on this thread, False if there is none left
+        """
+        while unclaimed:
+            if self.__run(unclaimed.popleft()):
+                with self.lock:
+                    self.num_helped += 1
+                return True
+        return False
+
+    def __run(self, future: Future) -> bool:
+        """
+        Run the task of future on this thread, False if it was cancelled or another thread claimed it first.
+        Its queue entry is skipped once a worker gets to it.
+        """
+        with self.lock:
+            task = self.tasks.pop(future, None)
+        if task is None or not future.set_running_or_notify_cancel():
+            return False
+        func, args = task
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        return True
+
+    def __work(self) -> None:
+        # every queue entry was handed to an idle worker or to a new one by `submit`, a worker only counts as idle again once it is done with one
+        while True:
+            _, _, future = self.queue.get()
+            if future is STOP:
+                break
+            self.__run(future)
+            with self.lock:
+                self.num_idle += 1
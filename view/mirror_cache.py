@@ -0,0 +1,107 @@
+import hashlib
+import os
+
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+from .concurrency import AdaptiveLimiter
+from .retry_policy import GitRetryPolicy
+from tuiframeworkpy.model.utils import get_application_folder
+
+
+class FileLock:
+    """
+    Exclusive inter-process lock backed by a lock file.
+    Blocks until the lock is acquired, so several TAs sharing a machine never touch the same mirror at once.
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self.file_handle = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file_handle = open(self.path, 'a+')
+        if os.name == 'nt':
+            import msvcrt
+
+            while True:
+                try:
+                    self.file_handle.seek(0)
+                    msvcrt.locking(self.file_handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after 10 seconds, keep waiting
+        else:
+            import fcntl
+
+            fcntl.flock(self.file_handle.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if os.name == 'nt':
+            import msvcrt
+
+            self.file_handle.seek(0)
+            msvcrt.locking(self.file_handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(self.file_handle.fileno(), fcntl.LOCK_UN)
+        self.file_handle.close()
+        self.file_handle = None
+
+
+def strip_credentials(url: str) -> str:
+    """
+    Remove any token embedded in a clone url so it is never used as a key or written to disk
+    """
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc.rsplit('@', 1)[-1], parts.path, parts.query, parts.fragment))
+
+
+class MirrorCache:
+    """
+    Persistent bare mirrors of student repos keyed by remote url.
+    Updating a mirror only transfers objects pushed since the last run.
+    Mirror fetches get the run's git timeouts and retries, so a stalled fetch cannot hold a mirror's lock forever,
+    and with a limiter they take a git slot like any other fetch.
+    """
+
+    def __init__(self, root: Path | str = None, limiter: AdaptiveLimiter = None, policy: GitRetryPolicy = None, env: dict = None) -> None:
+        self.root = Path(root) if root is not None else get_application_folder() / 'mirrors'
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.limiter = limiter
+        self.policy = policy
+        self.env = env  # environment of the run's git commands, None to inherit this process's
+
+    def mirror_path(self, clone_url: str) -> Path:
+        key = hashlib.sha256(strip_credentials(clone_url).encode()).hexdigest()[:32]
+        return self.root / f'{key}.git'
+
+    @contextmanager
+    def lock(self, clone_url: str):
+        with FileLock(self.mirror_path(clone_url).with_suffix('.lock')):
+            yield
+
+    def update(self, clone_url: str) -> tuple[Path, tuple]:
+        """
+        Create or fetch into the mirror for clone_url. Caller must hold `lock(clone_url)`.
+        The authenticated url is only passed on the command line, never stored in the mirror config.
+        """
+        path = self.mirror_path(clone_url)
+        if not (path / 'HEAD').exists():
+            result = self.run_git(['git', 'init', '-q', '--bare', str(path)])
+            if result[2] != 0:
+                return path, result
+            self.run_git(['git', 'config', 'uploadpack.allowAnySHA1InWant', 'true'], cwd=path)
+            self.run_git(['git', 'config', 'uploadpack.allowFilter', 'true'], cwd=path)
+            self.run_git(['git', 'config', 'gcis.remote', strip_credentials(clone_url)], cwd=path)
+        result = self.run_git(['git', 'fetch', '-q', '--prune', clone_url, '+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*'], cwd=path)
+        return path, result
+
+    def run_git(self, cmd: list, cwd=None) -> tuple[str | None, str | None, int]:
+        from .source_api_client import run_limited_cmd
+
+        return run_limited_cmd(cmd, cwd, self.limiter, self.policy, self.env)
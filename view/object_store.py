@@ -0,0 +1,57 @@
+import os
+
+from pathlib import Path
+from threading import Lock
+
+from .concurrency import AdaptiveLimiter
+from .retry_policy import GitRetryPolicy
+
+OBJECT_STORE_NAME = '.objects.git'
+
+
+class SharedObjectStore:
+    """
+    One bare object database per run that every clone in out_dir borrows from through git alternates.
+    It is seeded once with the assignment starter code, so starter objects are downloaded and stored a single time.
+    Clones depend on it, deleting the store breaks every repo in out_dir.
+    Seeding runs with the run's git timeouts and retries and takes a git slot from limiter, every clone waits on it.
+    """
+
+    def __init__(self, out_dir: Path | str, limiter: AdaptiveLimiter = None, policy: GitRetryPolicy = None, env: dict = None) -> None:
+        self.path = Path(out_dir) / OBJECT_STORE_NAME
+        self.limiter = limiter
+        self.policy = policy
+        self.env = env  # environment of the run's git commands, None to inherit this process's
+        self.seeded = False
+        self.lock = Lock()
+
+    def seed(self, seed_urls: list[str]) -> tuple | None:
+        """
+        Fetch the first url that works into the store. Only the first caller does any work,
+        every other clone waits here until the store is ready so it can borrow the seeded objects.
+        """
+        from .source_api_client import run_limited_cmd
+
+        with self.lock:
+            if self.seeded:
+                return None
+            self.seeded = True
+            if not (self.path / 'HEAD').exists():
+                result = run_limited_cmd(['git', 'init', '-q', '--bare', str(self.path)], policy=self.policy)
+                if result[2] != 0:
+                    return result
+            result = None
+            for i, seed_url in enumerate(url for url in seed_urls if url):
+                result = run_limited_cmd(['git', 'fetch', '-q', seed_url, f'+refs/heads/*:refs/heads/seed{i}/*'], self.path, self.limiter, self.policy, self.env)
+                if result[2] == 0:
+                    break
+            return result
+
+    def link(self, local_path: Path | str) -> None:
+        """
+        Point a repo's alternates at the store with a relative path, so out_dir can be moved or zipped as a whole
+        """
+        objects_path = Path(local_path) / '.git' / 'objects'
+        alternates = objects_path / 'info' / 'alternates'
+        alternates.parent.mkdir(parents=True, exist_ok=True)
+        alternates.write_text(os.path.relpath(self.path / 'objects', objects_path) + '\n')
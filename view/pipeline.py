@@ -0,0 +1,106 @@
+from heapq import heappop, heappush
+from itertools import count
+from threading import Event, Lock
+
+from .io_scheduler import IOScheduler, PRIORITY_STAGE
+
+
+class PipelineStage:
+    """
+    One step of a Pipeline. `func` is called on each item as a task on the pipeline's IOScheduler, at most `max_workers` at once,
+    items it returns True for are handed to the next stage as soon as they finish.
+    `max_workers` can be a callable read each time a task could start, so a stage follows a limiter's current limit instead of its largest.
+    If `priority` is given waiting items are taken lowest priority(item) first instead of in arrival order.
+    """
+
+    def __init__(self, name: str, func, max_workers, priority=None) -> None:
+        self.name = name
+        self.func = func
+        self.max_workers = max_workers
+        self.priority = priority
+        self.scheduler = None
+        self.scheduler_priority = PRIORITY_STAGE
+        self.next_stage = None
+        self.errors = []
+        self.waiting = []  # heap of (priority, arrival, item), items themselves are never compared
+        self.num_running = 0
+        self.closed = False
+        self.done = Event()
+        self.__order = count()
+        self.__lock = Lock()
+
+    @property
+    def limit(self) -> int:
+        return max(1, int(self.max_workers() if callable(self.max_workers) else self.max_workers))
+
+    def put(self, item) -> None:
+        with self.__lock:
+            heappush(self.waiting, (self.priority(item) if self.priority is not None else 0, next(self.__order), item))
+        self.__dispatch()
+
+    def close(self) -> None:
+        with self.__lock:
+            self.closed = True
+        self.__dispatch()
+
+    def join(self) -> None:
+        self.done.wait()
+
+    def __dispatch(self) -> None:
+        """
+        Start tasks for waiting items while the stage is under its limit, and close the next stage once this one is drained
+        """
+        items = []
+        with self.__lock:
+            while self.waiting and self.num_running < self.limit:
+                self.num_running += 1
+                items.append(heappop(self.waiting)[2])
+            finished = self.closed and not self.waiting and self.num_running == 0 and not self.done.is_set()
+            if finished:
+                self.done.set()
+        for item in items:
+            self.scheduler.submit(self.__run, item, priority=self.scheduler_priority)
+        if finished and self.next_stage is not None:
+            self.next_stage.close()
+
+    def __run(self, item) -> None:
+        try:
+            forward = self.func(item)
+        except Exception as e:
+            forward = False
+            self.errors.append((item, e))
+        try:
+            if forward and self.next_stage is not None:
+                self.next_stage.put(item)
+        finally:
+            # the item is in the next stage before this one can count as drained
+            with self.__lock:
+                self.num_running -= 1
+            self.__dispatch()
+
+
+class Pipeline:
+    """
+    Chain of PipelineStages running as tasks on one IOScheduler, each item moves to the next stage as soon as the previous one is done with it.
+    Later stages go first when tasks wait for a thread, so repos part way through finish before new ones start.
+    """
+
+    def __init__(self, stages: list[PipelineStage], scheduler: IOScheduler) -> None:
+        self.stages = stages
+        for i, stage in enumerate(stages):
+            stage.scheduler = scheduler
+            stage.scheduler_priority = PRIORITY_STAGE + len(stages) - 1 - i
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+
+    def run(self, items) -> list[tuple]:
+        """
+        Feed items through every stage and block until all stages are drained.
+        Returns (item, exception) for every item a stage raised on.
+        """
+        for item in items:
+            self.stages[0].put(item)
+        self.stages[0].close()
+        for stage in self.stages:
+            stage.join()
+        return [error for stage in self.stages for error in stage.errors]
@@ -0,0 +1,71 @@
+import heapq
+import shutil
+
+from pathlib import Path
+
+# rough per clone costs, a clone pays a fixed setup (auth, ref negotiation) plus its transfer
+CLONE_SETUP_SECONDS = 1.5
+CLONE_BYTES_PER_SECOND = 8 * 1024 * 1024
+# a full clone writes the packed history and a checked out copy of the files, an archive only the files
+DISK_BYTES_PER_REPO_BYTE = 2
+
+
+def lpt_makespan(durations: list[float], workers: int) -> float:
+    """
+    Time for `workers` parallel workers to finish every duration when the longest are started first
+    """
+    finish_times = [0.0] * max(1, int(workers))
+    for duration in sorted(durations, reverse=True):
+        heapq.heapreplace(finish_times, finish_times[0] + duration)
+    return max(finish_times)
+
+
+def free_disk_space(path: Path | str) -> int:
+    """
+    Free bytes on the disk path is (or will be) on
+    """
+    path = Path(path).absolute()
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    return shutil.disk_usage(path).free
+
+
+def format_bytes(num_bytes: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num_bytes < 1024:
+            return f'{round(num_bytes, 1)} {unit}'
+        num_bytes /= 1024
+    return f'{round(num_bytes, 1)} TB'
+
+
+class PreflightEstimate:
+    """
+    What a run would cost, worked out by a dry run from the repo sizes the API reported.
+    The clone time assumes clones are scheduled longest first on `workers` parallel clones.
+    """
+
+    def __init__(self, repo_sizes: list[int], workers: int, num_api_calls: int, api_seconds: float, out_dir: Path | str, archive: bool = False, rate_limit_remaining: str = None) -> None:
+        self.num_repos = len(repo_sizes)
+        self.num_unknown_sizes = sum(1 for size in repo_sizes if not size)
+        self.total_bytes = sum(repo_sizes)
+        self.disk_bytes = self.total_bytes if archive else self.total_bytes * DISK_BYTES_PER_REPO_BYTE
+        self.clone_seconds = lpt_makespan([CLONE_SETUP_SECONDS + (size / CLONE_BYTES_PER_SECOND) for size in repo_sizes], workers)
+        self.api_seconds = api_seconds
+        self.num_api_calls = num_api_calls
+        self.rate_limit_remaining = rate_limit_remaining
+        self.free_bytes = free_disk_space(out_dir)
+
+    @property
+    def fits_on_disk(self) -> bool:
+        return self.disk_bytes < self.free_bytes
+
+    def summary(self) -> str:
+        lines = [
+            f'Preflight: {self.num_repos} repos, {format_bytes(self.total_bytes)} to transfer'
+            + (f' ({self.num_unknown_sizes} repos of unknown size)' if self.num_unknown_sizes else ''),
+            f'Preflight: about {round(self.api_seconds + self.clone_seconds)} seconds ({round(self.api_seconds)}s api, {round(self.clone_seconds)}s cloning)',
+            f'Preflight: {format_bytes(self.disk_bytes)} of disk needed, {format_bytes(self.free_bytes)} free',
+            f'Preflight: {self.num_api_calls} api calls'
+            + (f', {self.rate_limit_remaining} left in the current rate limit window' if self.rate_limit_remaining is not None else ''),
+        ]
+        return '\n'.join(lines)
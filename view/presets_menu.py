@@ -1,3 +1,4 @@
+from .clone_preset import CLONE_STRATEGIES
 from .edit_preset_menu import EditPresetMenu
 
 from tuiframeworkpy import (
@@ -9,7 +10,7 @@ from tuiframeworkpy import (
     CYAN,
     WHITE,
 )
-from utils import bool_prompt, multichoice_prompt, list_to_multi_clone_presets, check_time
+from utils import bool_prompt, folders_list_prompt, hours_list_prompt, megabytes_prompt, multichoice_prompt, list_to_multi_clone_presets, check_time
 
 
 class PresetsMenu(SubMenu):
@@ -86,6 +87,11 @@ class PresetsMenu(SubMenu):
 
         preset_clone_source = self.context.config_manager.config.default_clone_source
         clone_source = multichoice_prompt(f'Is this preset for {LIGHT_GREEN}GitHub{WHITE} or {LIGHT_GREEN}GitLab{WHITE}? ', ['GitHub', 'GitLab'], 0 if preset_clone_source == 'GitHub' else 1)
+        clone_strategy = multichoice_prompt('How should repos be cloned (Full = full history, Shallow/Blobless = due commit only, Archive = due commit files without git)? ', CLONE_STRATEGIES, 0)
+        size_limit = megabytes_prompt('Flag repos larger than how many MB (enter for no limit)? ')
+        blob_limit = megabytes_prompt('Leave files larger than how many MB out of those repos (enter to clone them whole)? ') if size_limit else 0
+        extra_deadlines = hours_list_prompt('Also snapshot late deadlines, hours after the clone time separated by commas (e.g. 24,48, enter for none): ')
+        sparse_paths = folders_list_prompt('Only check out these folders, separated by commas (e.g. src/part2, enter for the whole repo): ')
 
         if not csv_path:
             csv_path = self.context.config_manager.config.students_csv
@@ -98,7 +104,12 @@ class PresetsMenu(SubMenu):
                 csv_path,
                 append_timestamp,
                 clone_type_flag,
-                clone_source
+                clone_source,
+                clone_strategy,
+                size_limit,
+                blob_limit,
+                extra_deadlines,
+                sparse_paths,
             ]
         )
         self.context.config_manager.save_config()
@@ -0,0 +1,131 @@
+import random
+import shutil
+
+from collections import deque
+from pathlib import Path
+from threading import Lock
+from types import SimpleNamespace
+
+from .concurrency import NETWORK_GIT_COMMANDS, TRANSIENT_GIT_ERRORS
+from utils import onerror
+
+DEFAULT_GIT_TIMEOUTS = {'clone': 900, 'fetch': 900, 'reset': 300, 'other': 120}
+DEFAULT_GIT_RETRIES = 2
+HEDGE_MIN_SAMPLES = 20
+HEDGE_SAMPLE_WINDOW = 500
+
+
+class GitRetryPolicy:
+    """
+    Timeouts per git phase, retries with jittered exponential backoff for transient network failures,
+    and hedging: once enough clones have finished, a clone running longer than the p95 clone time
+    gets a second attempt started next to it and whichever finishes first is kept.
+    """
+
+    def __init__(self, timeouts: dict = None, max_retries: int = DEFAULT_GIT_RETRIES, hedge: bool = False, base_delay: float = 1.0, max_delay: float = 30.0) -> None:
+        self.timeouts = dict(DEFAULT_GIT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.max_retries = max(0, int(max_retries))
+        self.hedge = hedge
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clone_durations = deque(maxlen=HEDGE_SAMPLE_WINDOW)
+        self.num_timeouts = 0
+        self.num_retries = 0
+        self.num_hedges = 0
+        self.num_hedges_won = 0
+        self.lock = Lock()
+
+    @classmethod
+    def from_config(cls, config) -> 'GitRetryPolicy':
+        timeouts = getattr(config, 'git_timeouts', None)
+        if isinstance(timeouts, SimpleNamespace):
+            timeouts = vars(timeouts)
+        return cls(timeouts, getattr(config, 'git_retries', DEFAULT_GIT_RETRIES), getattr(config, 'hedge_slow_clones', False))
+
+    def timeout_for(self, cmd: list) -> float | None:
+        """
+        Seconds cmd may run before it is killed, None for no limit
+        """
+        phase = cmd[1] if len(cmd) > 1 and cmd[1] in self.timeouts else 'other'
+        if cmd[1:2] == ['-c']:  # git -c key=value <command>
+            phase = cmd[3] if len(cmd) > 3 and cmd[3] in self.timeouts else 'other'
+        timeout = self.timeouts.get(phase, None)
+        return float(timeout) if timeout else None
+
+    def is_retryable(self, cmd: list, result: tuple | None) -> bool:
+        if len(cmd) < 2 or cmd[1] not in NETWORK_GIT_COMMANDS:
+            return False
+        if result is None:
+            return True
+        stderr = (result[1] or '').lower()
+        return result[2] != 0 and any(err in stderr for err in TRANSIENT_GIT_ERRORS)
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Full jitter, so repos that failed together do not all retry at the same moment
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2**attempt)))
+
+    def hedge_after(self, cmd: list) -> float | None:
+        """
+        Seconds after which a second attempt of cmd should be started, None if it should not be hedged
+        """
+        if not self.hedge or cmd[1:2] != ['clone']:
+            return None
+        with self.lock:
+            if len(self.clone_durations) < HEDGE_MIN_SAMPLES:
+                return None
+            durations = sorted(self.clone_durations)
+        return durations[int(len(durations) * 0.95) - 1]
+
+    def record(self, cmd: list, duration: float, result: tuple | None) -> None:
+        with self.lock:
+            if result is not None and 'timed out after' in (result[1] or ''):
+                self.num_timeouts += 1
+            elif result is not None and result[2] == 0 and cmd[1:2] == ['clone']:
+                self.clone_durations.append(duration)
+
+    def count_retry(self) -> None:
+        with self.lock:
+            self.num_retries += 1
+
+    def count_hedge(self, won: bool) -> None:
+        with self.lock:
+            self.num_hedges += 1
+            self.num_hedges_won += int(won)
+
+    def summary(self) -> str:
+        return f'Git retries: {self.num_retries} retries, {self.num_timeouts} timeouts, {self.num_hedges} hedged clones ({self.num_hedges_won} won by the hedge)'
+
+
+def hedge_clone_cmd(cmd: list) -> list:
+    """
+    The same clone into a sibling folder, so both attempts can run at once
+    """
+    return cmd[:-1] + [f'{cmd[-1]}.hedge']
+
+
+def discard_clone_target(cmd: list, cwd) -> None:
+    """
+    Remove what a killed or failed clone left behind so it can be cloned again
+    """
+    if cmd[1:2] != ['clone']:
+        return
+    target = Path(cwd) / cmd[-1]
+    if target.exists():
+        shutil.rmtree(target, onexc=onerror)
+
+
+def keep_hedge_clone(cmd: list, cwd, hedge_won: bool) -> None:
+    """
+    Move the winning hedge clone into the original folder, or remove the losing one
+    """
+    target = Path(cwd) / cmd[-1]
+    hedge_target = Path(cwd) / hedge_clone_cmd(cmd)[-1]
+    if hedge_won:
+        if target.exists():
+            shutil.rmtree(target, onexc=onerror)
+        hedge_target.rename(target)
+    elif hedge_target.exists():
+        shutil.rmtree(hedge_target, onexc=onerror)
@@ -0,0 +1,114 @@
+import json
+import os
+import re
+
+from pathlib import Path
+from threading import Lock
+
+
+class RunJournal:
+    """
+    Append only log of a clone run written next to its output folder.
+    Every repo status change is written and flushed as one json line, so an interrupted run
+    (Ctrl-C, network drop, laptop sleep) can pick up where it stopped instead of starting over.
+    A line cut off by a crash is ignored when the journal is read back.
+    """
+
+    def __init__(self, out_dir: Path | str) -> None:
+        self.out_dir = Path(out_dir)
+        self.path = self.out_dir.with_name(f'.{self.out_dir.name}.journal')
+        self.file_handle = None
+        self.lock = Lock()
+
+    @classmethod
+    def find_unfinished(cls, out_dir: Path | str, run_info: dict) -> 'RunJournal | None':
+        """
+        Journal of an interrupted run of run_info into out_dir, or into one of the out_dir_N folders
+        a run that kept an existing out_dir made instead. The most recent one if there are several.
+        """
+        out_dir = Path(out_dir)
+        suffix_regex = re.compile(rf'^\.{re.escape(out_dir.name)}(_(\d+))?\.journal$')
+        candidates = []
+        if out_dir.parent.exists():
+            for path in out_dir.parent.iterdir():
+                match = suffix_regex.match(path.name)
+                if match is not None:
+                    candidates.append((int(match.group(2) or 0), out_dir.with_name(path.name[1 : -len('.journal')])))
+        for _, candidate_dir in sorted(candidates, reverse=True):
+            journal = cls(candidate_dir)
+            if journal.can_resume(run_info):
+                return journal
+        return None
+
+    def read(self) -> list[dict]:
+        if not self.path.exists():
+            return []
+        entries = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return entries
+
+    def can_resume(self, run_info: dict) -> bool:
+        """
+        True if an unfinished journal exists for a run with the same assignment and due datetime
+        """
+        entries = self.read()
+        return bool(entries) and entries[0].get('event', None) == 'start' and entries[0].get('run', None) == run_info
+
+    def load(self) -> dict:
+        """
+        Last recorded state of each repo, keyed by repo folder name
+        """
+        repos = {}
+        for entry in self.read():
+            if 'repo' not in entry:
+                continue
+            state = repos.setdefault(entry['repo'], {})
+            state.update({key: value for key, value in entry.items() if value is not None})
+        return repos
+
+    def open(self, run_info: dict, resume: bool = False) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file_handle = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        if not resume:
+            self.write({'event': 'start', 'run': run_info})
+
+    def write(self, entry: dict) -> None:
+        with self.lock:
+            if self.file_handle is None:
+                return
+            self.file_handle.write(json.dumps(entry) + '\n')
+            self.file_handle.flush()
+
+    def record(self, repo, **extra) -> None:
+        entry = {
+            'repo': repo.out_name,
+            'status': repo.status.name,
+            'commit': repo.commit_hash,
+            'path': str(repo.local_path) if repo.local_path is not None else None,
+            'snapshot_commits': list(repo.snapshot_commits) or None,
+            'snapshot_paths': [str(path) if path is not None else None for path in repo.snapshot_paths] or None,
+        }
+        entry.update(extra)
+        self.write(entry)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file_handle is None:
+                return
+            self.file_handle.flush()
+            os.fsync(self.file_handle.fileno())
+            self.file_handle.close()
+            self.file_handle = None
+
+    def finish(self) -> None:
+        """
+        The run completed, nothing is left to resume
+        """
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
@@ -1,24 +1,42 @@
+import asyncio
 import csv
 import re
 import os
 import shutil
 import subprocess
+import tarfile
+import tempfile
 import gc
 
 from .clone_preset import ClonePreset
 from .clone_report import CloneReport
+from .async_engine import AsyncCloneEngine, DEFAULT_MAX_GIT_PROCESSES
+from .concurrency import AdaptiveLimiter, is_network_git_cmd, release_git_limiter
+from .git_proxy import GitCacheProxy
+from .git_trace import GitTrace, trace_summary
+from .io_scheduler import IOScheduler, PRIORITY_PAGE
+from .mirror_cache import MirrorCache
+from .object_store import OBJECT_STORE_NAME, SharedObjectStore
+from .pipeline import Pipeline, PipelineStage
+from .preflight import PreflightEstimate, format_bytes
+from .retry_policy import GitRetryPolicy, discard_clone_target, hedge_clone_cmd, keep_hedge_clone
+from .run_journal import RunJournal
+from .ssh_transport import SshCommandCounter, SshMultiplexer
 from .student_param import StudentParam
 from tuiframeworkpy import LIGHT_GREEN, LIGHT_RED, CYAN, WHITE, YELLOW, MAGENTA
-from utils import clear
+from utils import clear, kill_process_tree
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from functools import partial
 from datetime import date, datetime, timedelta, timezone
 from enum import Enum
+from itertools import count
+from threading import Lock, current_thread, local
+from typing import Callable
 from urllib.parse import urlencode, quote
 
 from pprint import pformat
-from time import perf_counter
+from time import perf_counter, sleep, time
 from pathlib import Path
 from traceback import format_exc
 
@@ -27,25 +45,134 @@ UTC_OFFSET = datetime.now(timezone.utc).astimezone().utcoffset() // timedelta(ho
 CURRENT_TIMEZONE = timezone(timedelta(hours=UTC_OFFSET))
 VALID_TIME_REGEX = re.compile(r'^[0-2][0-9]:[0-5][0-9]$')
 VALID_DATE_REGEX = re.compile(r'^\d{4}-[0-1][0-9]-[0-3][0-9]$')
+REPORT_LOCK = Lock()
+# most API requests in flight at once
+MAX_API_REQUESTS = 32
+# commits fetched by the first deepen of a history trimmed clone missing its due commit, each further deepen fetches 4x more
+DEEPEN_COMMITS = 50
+MAX_DEEPENS = 3
 
 
-def run_cmd(cmd: str | list, cwd=None) -> tuple[str | None, str | None]:
+def run_cmd(cmd: str | list, cwd=None, timeout: float = None, env: dict = None) -> tuple[str | None, str | None]:
     """
     Syncronously start a subprocess and run a command returning its output
+    The process is killed if it runs longer than timeout seconds, env replaces the environment it inherits if given
     """
     if cwd is None:
         cwd = os.getcwd()
 
     proc = None
     if isinstance(cmd, str):
-        proc = subprocess.Popen(cmd, cwd=cwd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, shell=True)
+        proc = subprocess.Popen(cmd, cwd=cwd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, shell=True, start_new_session=timeout is not None, env=env)
     elif isinstance(cmd, list):
-        proc = subprocess.Popen(cmd, cwd=cwd, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        proc = subprocess.Popen(cmd, cwd=cwd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, start_new_session=timeout is not None, env=env)
 
-    stdout, stderr = proc.communicate()
+    return communicate(proc, timeout)
+
+
+def communicate(proc: subprocess.Popen, timeout: float = None) -> tuple[str | None, str | None, int]:
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_process_tree(proc)
+        stdout, stderr = proc.communicate()
+        stderr = (stderr or b'') + f'\ntimed out after {timeout}s'.encode()
     return (stdout.decode().strip() if stdout else None, stderr.decode().strip() if stderr else None, proc.returncode)
 
 
+def run_hedged_clone(cmd: list, cwd, policy: GitRetryPolicy, limiter: AdaptiveLimiter, hedge_after: float, env: dict = None) -> tuple[str | None, str | None, int]:
+    """
+    Run a git clone and, if it is still running after hedge_after seconds and a clone slot is free,
+    start a second attempt into a sibling folder. The first to succeed is kept and the other is killed.
+    """
+    timeout = policy.timeout_for(cmd)
+    procs = []
+
+    def attempt(attempt_cmd: list) -> tuple[str | None, str | None, int]:
+        proc = subprocess.Popen(attempt_cmd, cwd=cwd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, start_new_session=True, env=env)
+        procs.append(proc)
+        return communicate(proc, timeout)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        primary = executor.submit(attempt, cmd)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done or (limiter is not None and not limiter.try_acquire()):
+            return primary.result()
+        hedge_start = perf_counter()
+        hedge = executor.submit(attempt, hedge_clone_cmd(cmd))
+        winner = None
+        for future in as_completed([primary, hedge]):
+            if future.result()[2] == 0:
+                winner = future
+                break
+        for proc in procs:
+            if proc.poll() is None:
+                kill_process_tree(proc)
+    hedge_won = winner is hedge
+    if limiter is not None and hedge_won:
+        release_git_limiter(limiter, perf_counter() - hedge_start, hedge.result())
+    elif limiter is not None:
+        limiter.release_slot()  # killed or failed next to the primary, says nothing about the link
+    policy.count_hedge(hedge_won)
+    keep_hedge_clone(cmd, cwd, hedge_won)
+    return hedge.result() if hedge_won else primary.result()
+
+
+def run_limited_once(cmd: list, cwd=None, limiter: AdaptiveLimiter = None, policy: GitRetryPolicy = None, env: dict = None) -> tuple[str | None, str | None, int]:
+    is_network = limiter is not None and is_network_git_cmd(cmd)
+    if is_network:
+        limiter.acquire()
+    start = perf_counter()
+    result = None
+    try:
+        hedge_after = policy.hedge_after(cmd) if policy is not None else None
+        if hedge_after is not None:
+            result = run_hedged_clone(cmd, cwd, policy, limiter, hedge_after, env)
+        else:
+            result = run_cmd(cmd, cwd=cwd, timeout=policy.timeout_for(cmd) if policy is not None else None, env=env)
+        return result
+    finally:
+        if is_network:
+            release_git_limiter(limiter, perf_counter() - start, result)
+        if policy is not None:
+            policy.record(cmd, perf_counter() - start, result)
+
+
+def run_limited_cmd(cmd: list, cwd=None, limiter: AdaptiveLimiter = None, policy: GitRetryPolicy = None, env: dict = None) -> tuple[str | None, str | None, int]:
+    """
+    Run one git command. Network commands wait for a slot from limiter if one is given.
+    With a policy the command is killed after its phase timeout and transient network failures are retried with backoff.
+    """
+    attempt = 0
+    while True:
+        result = run_limited_once(cmd, cwd, limiter, policy, env)
+        if policy is None or attempt >= policy.max_retries or not policy.is_retryable(cmd, result):
+            return result
+        attempt += 1
+        policy.count_retry()
+        discard_clone_target(cmd, cwd)
+        sleep(policy.backoff(attempt))
+
+
+def run_steps(steps, limiter: AdaptiveLimiter = None, policy: GitRetryPolicy = None, trace: GitTrace = None, env: dict = None) -> tuple[str | None, str | None, int]:
+    """
+    Drive a git step generator, running each (cmd, cwd) it yields with `run_cmd` and sending the result back.
+    Network commands wait for a slot from limiter if one is given, policy adds timeouts, retries and hedging.
+    With a trace the phases of every command are added to it, env replaces the environment the commands inherit if given.
+    """
+    try:
+        cmd, cwd = next(steps)
+        while True:
+            if trace is None:
+                result = run_limited_cmd(cmd, cwd, limiter, policy, env)
+            else:
+                traced_cmd, traced_env = trace.wrap(cmd, env)
+                result = trace.collect(traced_cmd, run_limited_cmd(traced_cmd, cwd, limiter, policy, traced_env))
+            cmd, cwd = steps.send(result)
+    except StopIteration as e:
+        return e.value
+
+
 def bool_prompt(prompt: str, default_output: bool) -> bool:
     y_str = 'Y' if default_output else 'y'
     n_str = 'N' if not default_output else 'n'
@@ -65,6 +192,18 @@ def multichoice_prompt(prompt: str, options: list, default_index: int):
         print(f'{LIGHT_RED}Invalid option. Please choose one of the options above.{WHITE}')
 
 
+def is_throttled_response(response) -> bool:
+    """
+    429, or a 403 that carries rate limit headers (GitHub secondary rate limits)
+    """
+    if response.status_code == 429:
+        return True
+    if response.status_code != 403:
+        return False
+    headers = response.headers or {}
+    return 'retry-after' in headers or headers.get('x-ratelimit-remaining', None) == '0'
+
+
 def get_page_by_rel(links: str, rel: str = 'last'):
     val = re.findall(rf'.*&page=(\d+).*>; rel="{rel}"', links)
     if val:
@@ -73,8 +212,9 @@ def get_page_by_rel(links: str, rel: str = 'last'):
 
 
 def pformat_objects(x):
+    # a shallow copy, the debug log formats objects at flush time and deep copies would cost the run they are logging
     try:
-        copy = deepcopy(x)
+        copy = dict(x) if isinstance(x, dict) else x
         try:
             del copy['__builtins__']
         except Exception:
@@ -132,12 +272,24 @@ class LogLevel(Enum):
 
 
 class LogHandler:
+    """
+    Debug log that stays out of the way of the run it logs.
+    Every thread appends records to a buffer of its own without taking a lock, records are censored, formatted and written
+    in time order at flush time, a message can be a callable so expensive formatting only happens then.
+    A thread's buffer is flushed once it holds FLUSH_RECORDS records while a log file is open, and everything left on close.
+    """
+
+    FLUSH_RECORDS = 1000
+
     def __init__(self, log_level: LogLevel) -> None:
         self.log_level = log_level
         self.log_file_handler = None
-        self.log_cache: dict[str, list] = {}
+        self.buffers: list[list] = []
+        self.local = local()
+        self.lock = Lock()
+        self.request_ids = count(1)
         self.log_level_strings = {LogLevel.DEBUG: 'DEBUG', LogLevel.INFO: 'INFO', LogLevel.WARNING: 'WARNING', LogLevel.ERROR: 'ERROR', LogLevel.CRITICAL: 'CRITICAL'}
-        self.log_prefix = '%%DATETIME%% - [%%LOGLEVEL%%][%%CALLER%%]:'
+        self.log_prefix = '%%DATETIME%% - [%%LOGLEVEL%%][%%CALLER%%][%%THREAD%%]%%REQUEST%%:'
         self.prefix_ljust = 25
         self.censored_strs = []
 
@@ -146,75 +298,76 @@ class LogHandler:
             return
         self.log_file_handler = open(log_file, 'w')
 
-    def _fill_prefix(self, log_level: LogLevel, caller_str: str) -> str:
-        current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        return self.log_prefix.replace('%%DATETIME%%', current_datetime).replace('%%LOGLEVEL%%', self.log_level_strings[log_level]).replace('%%CALLER%%', caller_str).ljust(self.prefix_ljust)
+    def new_request_id(self) -> int:
+        """
+        Id tying together the records logged for one API request
+        """
+        return next(self.request_ids)
+
+    def _fill_prefix(self, log_level: LogLevel, caller_str: str, timestamp: float, thread_name: str, request_id: int | None) -> str:
+        current_datetime = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        request_str = f'[#{request_id}]' if request_id is not None else ''
+        prefix = self.log_prefix.replace('%%DATETIME%%', current_datetime).replace('%%LOGLEVEL%%', self.log_level_strings[log_level])
+        return prefix.replace('%%CALLER%%', caller_str).replace('%%THREAD%%', thread_name).replace('%%REQUEST%%', request_str).ljust(self.prefix_ljust)
 
     def _censor_str(self, log_str: str) -> str:
         for censored_str in self.censored_strs:
             log_str = log_str.replace(censored_str, '<REDACTED>')
         return log_str
 
-    def _append(self, log_level: LogLevel, log_str: str, caller: str | object = 'MAIN') -> None:
-        if log_level.value >= self.log_level.value:
-            caller_str = caller if isinstance(caller, str) else caller.__class__.__name__.upper()
-            if caller_str not in self.log_cache:
-                self.log_cache[caller_str] = []
-            self.log_cache[caller_str].append((log_level, self._censor_str(log_str)))
+    def _buffer(self) -> list:
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            buffer = self.local.buffer = []
+            with self.lock:
+                self.buffers.append(buffer)
+        return buffer
 
-    def _flush(self) -> None:
-        if self.log_file_handler is None:
+    def _append(self, log_level: LogLevel, log_str: str | Callable[[], str], caller: str | object = 'MAIN', request_id: int = None) -> None:
+        if log_level.value < self.log_level.value:
             return
-        for caller_str in self.log_cache:
-            for log_level, log_str in self.log_cache[caller_str]:
-                self._write(log_level, log_str, caller_str, flush=False)
-            self.log_cache[caller_str].clear()
-
-    def _write(self, log_level: LogLevel, log_str: str, caller: str | object = 'MAIN', flush: bool = True) -> None:
-        if self.log_file_handler is None:
-            return
-        if flush:
-            self._flush()
         caller_str = caller if isinstance(caller, str) else caller.__class__.__name__.upper()
-        prefix = self._fill_prefix(log_level, caller_str)
-        if log_level.value >= self.log_level.value:
-            self.log_file_handler.write(f'{prefix}{self._censor_str(log_str)}\n')
-
-    def debug(self, log_str: str, caller: str | object = 'MAIN', flush: bool = True) -> None:
-        if self.log_file_handler is None:
-            self._append(LogLevel.DEBUG, log_str, caller)
-        else:
-            self._write(LogLevel.DEBUG, log_str, caller, flush)
-
-    def info(self, log_str: str, caller: str | object = 'MAIN', flush: bool = True) -> None:
-        if self.log_file_handler is None:
-            self._append(LogLevel.INFO, log_str, caller)
-        else:
-            self._write(LogLevel.INFO, log_str, caller, flush)
-
-    def warning(self, log_str: str, caller: str | object = 'MAIN', flush: bool = True) -> None:
-        if self.log_file_handler is None:
-            self._append(LogLevel.WARNING, log_str, caller)
-        else:
-            self._write(LogLevel.WARNING, log_str, caller, flush)
-
-    def error(self, log_str: str, caller: str | object = 'MAIN', flush: bool = True) -> None:
-        if self.log_file_handler is None:
-            self._append(LogLevel.ERROR, log_str, caller)
-        else:
-            self._write(LogLevel.ERROR, log_str, caller, flush)
-
-    def critical(self, log_str: str, caller: str | object = 'MAIN', flush: bool = True) -> None:
-        if self.log_file_handler is None:
-            self._append(LogLevel.CRITICAL, log_str, caller)
-        else:
-            self._write(LogLevel.CRITICAL, log_str, caller, flush)
+        buffer = self._buffer()
+        buffer.append((time(), log_level, caller_str, current_thread().name, request_id, log_str))
+        if len(buffer) >= self.FLUSH_RECORDS and self.log_file_handler is not None:
+            self._flush()
 
-    def print_and_log(self, log_str: str, log_level: LogLevel, caller: str | object = 'MAIN', flush: bool = True) -> None:
+    def _flush(self) -> None:
         if self.log_file_handler is None:
-            self._append(log_level, log_str, caller)
-        else:
-            self._write(log_level, log_str, caller, flush)
+            return
+        with self.lock:
+            records = []
+            for buffer in self.buffers:
+                # only the records there now are taken, the owning thread may be appending more
+                num_records = len(buffer)
+                records.extend(buffer[:num_records])
+                del buffer[:num_records]
+            records.sort(key=lambda record: record[0])
+            for timestamp, log_level, caller_str, thread_name, request_id, log_str in records:
+                self._write(log_level, log_str() if callable(log_str) else log_str, caller_str, timestamp, thread_name, request_id)
+            self.log_file_handler.flush()
+
+    def _write(self, log_level: LogLevel, log_str: str, caller_str: str, timestamp: float, thread_name: str, request_id: int | None) -> None:
+        prefix = self._fill_prefix(log_level, caller_str, timestamp, thread_name, request_id)
+        self.log_file_handler.write(f'{prefix}{self._censor_str(log_str)}\n')
+
+    def debug(self, log_str: str | Callable[[], str], caller: str | object = 'MAIN', request_id: int = None) -> None:
+        self._append(LogLevel.DEBUG, log_str, caller, request_id)
+
+    def info(self, log_str: str | Callable[[], str], caller: str | object = 'MAIN', request_id: int = None) -> None:
+        self._append(LogLevel.INFO, log_str, caller, request_id)
+
+    def warning(self, log_str: str | Callable[[], str], caller: str | object = 'MAIN', request_id: int = None) -> None:
+        self._append(LogLevel.WARNING, log_str, caller, request_id)
+
+    def error(self, log_str: str | Callable[[], str], caller: str | object = 'MAIN', request_id: int = None) -> None:
+        self._append(LogLevel.ERROR, log_str, caller, request_id)
+
+    def critical(self, log_str: str | Callable[[], str], caller: str | object = 'MAIN', request_id: int = None) -> None:
+        self._append(LogLevel.CRITICAL, log_str, caller, request_id)
+
+    def print_and_log(self, log_str: str, log_level: LogLevel, caller: str | object = 'MAIN') -> None:
+        self._append(log_level, log_str, caller)
         print(log_str)
 
     def close(self) -> None:
@@ -254,13 +407,41 @@ class RepoStatus(Enum):
     COMMIT_FOUND     = ( 5, 'Commit Found.'.ljust(STATUS_LJUST), LIGHT_GREEN, False)
     CLONED_DONE      = ( 9, 'Cloned'.ljust(STATUS_LJUST), LIGHT_GREEN,         True)
     RESET            = (11, 'Reset'.ljust(STATUS_LJUST), LIGHT_GREEN,          True)
+    UP_TO_DATE       = (12, 'Up To Date.'.ljust(STATUS_LJUST), LIGHT_GREEN,    True)
+    DOWNLOADED       = (13, 'Downloaded.'.ljust(STATUS_LJUST), LIGHT_GREEN,    True)
 
-    # warnings, each with its own hue
+    # warnings
+    TRUNCATED        = (14, 'Reset, Large Files Left Out.'.ljust(STATUS_LJUST),          YELLOW,  True)
     NOT_FOUND        = ( 3, 'Repo Does Not Exist.'.ljust(STATUS_LJUST),  YELLOW,                  True)
     NO_COMMITS       = ( 6, 'Repo Has No Commits.'.ljust(STATUS_LJUST),    CYAN,                  True)
     COMMIT_NOT_FOUND = ( 7, 'Commit Not Found Before Due Datetime.'.ljust(STATUS_LJUST), MAGENTA, True)
 
 
+# statuses a resumed run keeps, every other repo is processed again
+RESUMABLE_CLONED_STATUSES = ('CLONED_DONE', 'RESET', 'UP_TO_DATE', 'DOWNLOADED', 'TRUNCATED')
+RESUMABLE_DONE_STATUSES = RESUMABLE_CLONED_STATUSES + ('NOT_FOUND', 'NO_COMMITS', 'COMMIT_NOT_FOUND')
+
+
+class CloneStrategy(Enum):
+    """
+    Enum for how a repo is brought to its due commit
+    FULL clones the whole history then resets, SHALLOW and BLOBLESS only fetch the due commit
+    ARCHIVE downloads the files at the due commit through the API without any git history
+    """
+
+    FULL = 'Full'
+    SHALLOW = 'Shallow'
+    BLOBLESS = 'Blobless'
+    ARCHIVE = 'Archive'
+
+    @classmethod
+    def from_str(cls, value: str) -> 'CloneStrategy':
+        for strategy in cls:
+            if strategy.value == value:
+                return strategy
+        return cls.FULL
+
+
 class APIClient:
     def __init__(self, access_token: str, organization: str, headers: dict, log_handler: LogHandler) -> None:
         self.access_token = access_token
@@ -269,11 +450,16 @@ class APIClient:
         self.log_handler = log_handler
         self.debug = self.log_handler.log_level == LogLevel.DEBUG
         self.session = None
+        self.rate_limit_remaining = None
+        self.git_proxy = None  # GitCacheProxy repos clone through while a run has one
+        self.ssh = None  # SshMultiplexer while a run clones over ssh instead of https
+        self.request_limiter = AdaptiveLimiter('API requests', int((os.cpu_count() or 1) * 1.25), max_limit=MAX_API_REQUESTS)
+        self.scheduler = make_io_scheduler()  # replaced by the batch's when the client is part of one
 
         #self.prefix_exists_params
         #self.push_params
 
-    def sync_request(self, url: str, params: dict = None):
+    def sync_request(self, url: str, params: dict = None, stream: bool = False):
         import niquests
 
         if self.session is None:
@@ -281,17 +467,29 @@ class APIClient:
             if self.debug:
                 self.log_handler.info('Session Created.', self)
                 self.log_handler.debug('*** SESSION ***', self)
-                self.log_handler.debug(pformat_objects(self.session), self)
+                self.log_handler.debug(lambda: pformat_objects(self.session), self)
                 self.log_handler.debug('*' * 50, self)
         if params is None:
             params = {}
 
         url = f'{url}?{urlencode(params)}'
-        response = self.session.get(url, headers=self.headers)
-        if self.debug:
-            self.log_handler.debug(f'*** API RESPONSE [URL={url}] ***', self)
-            self.log_handler.debug(pformat_objects(response), self)
-            self.log_handler.debug('*' * 50, self)
+        self.request_limiter.acquire()
+        start = perf_counter()
+        try:
+            response = self.session.get(url, headers=self.headers, stream=stream)
+        except Exception:
+            self.request_limiter.release(perf_counter() - start, ok=False)
+            raise
+        # a multiplexed session answers with a lazy response, reading the status waits for it so the limiter sees the whole round trip
+        status_code = response.status_code
+        self.request_limiter.release(perf_counter() - start, ok=status_code < 500, throttled=is_throttled_response(response))
+        headers = response.headers or {}
+        self.rate_limit_remaining = headers.get('x-ratelimit-remaining', None) or headers.get('ratelimit-remaining', None) or self.rate_limit_remaining
+        if self.debug and not stream:
+            # responses are not changed after this, formatting one waits for the log to be flushed
+            request_id = self.log_handler.new_request_id()
+            self.log_handler.debug(f'*** API RESPONSE [URL={url}] [{round((perf_counter() - start) * 1000)}ms] ***', self, request_id=request_id)
+            self.log_handler.debug(lambda: pformat_objects(response), self, request_id=request_id)
         return response
 
     def repo_prefix_exists(self, repo_prefix: str):
@@ -300,13 +498,54 @@ class APIClient:
     def get_commit_before_by_repo(self, datetime: datetime, repo):
         raise NotImplementedError()
 
+    def get_commits_before_by_repo(self, datetimes: list[datetime], repo) -> list[str | None]:
+        """
+        Last commit pushed before each of datetimes from one read of the repo's push activity, None where there is none.
+        The repo is marked Commit Found if any of them was found.
+        """
+        raise NotImplementedError()
+
     def get_repo(self, repo: 'GitRepo') -> dict:
         raise NotImplementedError()
 
+    def get_repo_size(self, repo: 'GitRepo') -> int:
+        """
+        Repo size in bytes, 0 if the API does not report it. Only asked for when a size limit is set, it may cost a request.
+        """
+        return repo.get_size()
+
     def get_push_count(self, repo: 'GitRepo') -> dict:
         raise NotImplementedError()
 
+    def get_archive_request(self, repo: 'GitRepo', commit_hash: str | None) -> tuple[str, dict]:
+        raise NotImplementedError()
+
+    def download_archive(self, repo: 'GitRepo', commit_hash: str | None, dest: Path | str) -> tuple[str | None, str | None, int]:
+        """
+        Stream the gzipped tarball of the repo at commit_hash and extract it into dest as it downloads.
+        The single top level folder the servers wrap the archive in is dropped.
+        Returns a (stdout, stderr, exitcode) tuple like `run_cmd`.
+        """
+        url, params = self.get_archive_request(repo, commit_hash)
+        response = self.sync_request(url, params, stream=True)
+        try:
+            if response.status_code != 200:
+                return None, f'Archive request failed with status {response.status_code}', response.status_code
+            dest = Path(dest)
+            with tarfile.open(fileobj=response.raw, mode='r|gz') as archive:
+                for member in archive:
+                    _, _, member.name = member.name.partition('/')
+                    if not member.name:
+                        continue
+                    archive.extract(member, dest, filter='data')
+            return None, None, 0
+        except (tarfile.TarError, OSError) as e:
+            return None, str(e), -1
+        finally:
+            response.close()
+
     def close(self):
+        self.scheduler.close()
         if self.session is not None:
             self.session.close()
             self.session = None
@@ -317,6 +556,7 @@ class APIClient:
 
 class GitRepo:
     def __init__(self, api_client: APIClient, repo_info: dict = None, status: RepoStatus = RepoStatus.INIT, prefix: str = None, real_name: str = None, username: str = None, local_path: str = None, hours_adjust: int = 0) -> None:
+        self.journal = None
         self.repo_info = repo_info
         self.prefix = prefix
         self.real_name = real_name
@@ -327,10 +567,32 @@ class GitRepo:
         self.status = RepoStatus.INIT
         self.api_client = api_client
         self.hours_adjust = timedelta(hours=hours_adjust)
+        self.commit_hash = None
+        self.oversized = False
+        self.blob_limit = None
+        self.truncated_paths = []
+        self.snapshot_commits = []
+        self.snapshot_paths = []
+        self.shallow_since = None
+        self.deepened = False
+        self.sparse_paths = []
+        self.indexed = False
+        self.proxy_fresh_after = None
+        self.trace = None  # GitTrace its git commands add their phases to while the run traces them
 
     def __repr__(self):
         return f'<GitRepo: {self.prefix}-{self.username}, status={self.status}, hours_adjust={self.hours_adjust}, repo_info={self.repo_info}>'
 
+    @property
+    def status(self) -> RepoStatus:
+        return self.__status
+
+    @status.setter
+    def status(self, status: RepoStatus) -> None:
+        self.__status = status
+        if self.journal is not None:
+            self.journal.record(self)
+
     def get_info(self):
         self.status = RepoStatus.RETRIEVING
         response_status_code, self.repo_info = self.api_client.get_repo(self)
@@ -345,7 +607,16 @@ class GitRepo:
     def get_commit_before(self, datetime: datetime):
         return self.api_client.get_commit_before_by_repo(datetime + self.hours_adjust, self)
 
-    def clone(self, out_dir: Path | str, depth: int = None, single_branch: bool = True, use_cloned_done: bool = False, dry_run: bool = False):
+    def clone(self, out_dir: Path | str, depth: int = None, single_branch: bool = True, use_cloned_done: bool = False, dry_run: bool = False, mirror_cache: MirrorCache = None, object_store: SharedObjectStore = None, no_checkout: bool = False, blob_limit: int = None, shallow_since: datetime = None, sparse_paths: list[str] = None):
+        return run_steps(self.clone_steps(out_dir, depth, single_branch, use_cloned_done, dry_run, mirror_cache, object_store, no_checkout, blob_limit, shallow_since, sparse_paths), trace=self.trace, env=self.git_env())
+
+    def clone_steps(self, out_dir: Path | str, depth: int = None, single_branch: bool = True, use_cloned_done: bool = False, dry_run: bool = False, mirror_cache: MirrorCache = None, object_store: SharedObjectStore = None, no_checkout: bool = False, blob_limit: int = None, shallow_since: datetime = None, sparse_paths: list[str] = None):
+        """
+        Clone the repo into out_dir. With no_checkout only the git objects are written, `reset` creates the working tree.
+        With blob_limit files larger than blob_limit bytes are not downloaded and are left out of the working tree.
+        With shallow_since (UTC) only history committed after it is cloned, `reset` deepens it if the commit it needs is older.
+        With sparse_paths no files are downloaded by the clone, only the ones in those folders (and the repo root) are when they are checked out.
+        """
         self.status = RepoStatus.CLONING
         clone_url = self.get_clone_url()
         if clone_url is None:
@@ -356,58 +627,465 @@ class GitRepo:
             cmd.append('--single-branch')
         if depth is not None:
             cmd.extend(['--depth', str(depth)])
+        shallow_since_arg = None
+        if shallow_since is not None and depth is None:
+            shallow_since_arg = f'--shallow-since={shallow_since.strftime("%Y-%m-%d %H:%M:%S")} +0000'
+            cmd.append(shallow_since_arg)
+        if sparse_paths:
+            # every file outside the sparse folders is left out already, large or not
+            blob_limit = None
+            cmd.append('--filter=blob:none')
+            no_checkout = True
+        if blob_limit:
+            # a checkout would fetch the filtered blobs on demand, the working tree is written once they are excluded
+            cmd.append(f'--filter=blob:limit={blob_limit}')
+            no_checkout = True
+        if no_checkout:
+            cmd.append('--no-checkout')
         cmd.extend([clone_url, self.out_name])
         self.local_path = Path(out_dir) / self.out_name
         stdout, stderr, exitcode = None, None, 0
-        if not dry_run:
-            stdout, stderr, exitcode = run_cmd(cmd, cwd=out_dir)
-        if exitcode == 0:
+        if dry_run:
+            pass
+        elif object_store is not None:
+            # borrow starter code objects from the run's shared store, takes precedence over the mirror cache
+            object_store.seed([self.get_seed_clone_url(), clone_url])
+            cmd[2:2] = ['--reference', str(object_store.path)]
+            stdout, stderr, exitcode = yield cmd, out_dir
+            if exitcode == 0:
+                object_store.link(self.local_path)
+        elif mirror_cache is None:
+            stdout, stderr, exitcode = yield cmd, out_dir
+        else:
+            # update the mirror then borrow its objects, only objects missing from the mirror cross the network
+            with mirror_cache.lock(clone_url):
+                mirror_path, mirror_result = mirror_cache.update(clone_url)
+                if mirror_result[2] == 0:
+                    cmd[2:2] = ['--reference', str(mirror_path), '--dissociate']
+                stdout, stderr, exitcode = yield cmd, out_dir
+        if exitcode != 0 and shallow_since_arg is not None and 'no commits selected' in (stderr or ''):
+            # nothing was committed inside the window, start from the last commit and let `deepen_to_steps` go back from there
+            cmd[cmd.index(shallow_since_arg)] = '--depth=1'
+            stdout, stderr, exitcode = yield cmd, out_dir
+        if exitcode == 0 and shallow_since_arg is not None and not dry_run:
+            self.shallow_since = shallow_since
+        if exitcode == 0 and sparse_paths and not dry_run:
+            self.sparse_paths = list(sparse_paths)
+            if use_cloned_done:
+                stdout, stderr, exitcode = yield from self.sparse_checkout_steps()
+                if exitcode == 0:
+                    stdout, stderr, exitcode = yield ['git', 'reset', '--hard', '-q', 'HEAD'], self.local_path
+        if exitcode == 0 and blob_limit and not dry_run:
+            self.blob_limit = blob_limit
+            if use_cloned_done:
+                (stdout, stderr, exitcode), self.truncated_paths = yield from self.exclude_missing_blobs_steps('HEAD')
+                if exitcode == 0:
+                    stdout, stderr, exitcode = yield ['git', 'reset', '--hard', '-q', 'HEAD'], self.local_path
+        if exitcode == 0 and self.truncated_paths and use_cloned_done:
+            self.status = RepoStatus.TRUNCATED
+        elif exitcode == 0:
             self.status = RepoStatus.CLONED if not use_cloned_done else RepoStatus.CLONED_DONE
         else:
             self.status = RepoStatus.CLONE_ERROR
         return stdout, stderr, exitcode
 
-    def reset(self, commit_hash: str, dry_run: bool = False):
+    def deepen_to_steps(self, commit_hash: str):
+        """
+        Deepen a history trimmed clone until it has commit_hash, which is older than the window when it was committed long before it was pushed.
+        Fetches the whole history if a few deepens were not enough.
+        """
+        deepen_by = DEEPEN_COMMITS
+        for _ in range(MAX_DEEPENS):
+            _, _, exitcode = yield ['git', 'cat-file', '-e', f'{commit_hash}^{{commit}}'], self.local_path
+            if exitcode == 0:
+                return
+            self.deepened = True
+            yield ['git', 'fetch', '-q', f'--deepen={deepen_by}', 'origin'], self.local_path
+            deepen_by *= 4
+        _, _, exitcode = yield ['git', 'cat-file', '-e', f'{commit_hash}^{{commit}}'], self.local_path
+        if exitcode != 0:
+            yield ['git', 'fetch', '-q', '--unshallow', 'origin'], self.local_path
+
+    def sparse_checkout_steps(self, worktree: Path | str = None):
+        """
+        Limit the working tree (local_path unless given) to the sparse_paths folders before it is checked out, in a partial clone files outside them are never downloaded.
+        `git sparse-checkout disable` in the repo downloads and writes the whole repo.
+        Needs git 2.35, if it fails the repo must not be checked out, that would download every file.
+        """
+        worktree = worktree if worktree is not None else self.local_path
+        return (yield ['git', 'sparse-checkout', 'set', '--cone'] + self.sparse_paths, worktree)
+
+    def exclude_missing_blobs_steps(self, commit_hash: str, worktree: Path | str = None):
+        """
+        Exclude the files of commit_hash a size filtered clone did not download from the working tree (local_path unless given) with a sparse checkout,
+        so checking it out does not fetch them after all. Returns the result of the sparse checkout and the excluded paths.
+        `git sparse-checkout disable` in the repo downloads and writes them.
+        If the sparse checkout fails (git older than 2.35) the repo must not be checked out, that would download the files it left out.
+        """
+        worktree = worktree if worktree is not None else self.local_path
+        stdout, _, exitcode = yield ['git', 'rev-list', '--objects', '--missing=print', '--no-walk', commit_hash], worktree
+        missing = {line[1:] for line in (stdout or '').splitlines() if line.startswith('?')}
+        if exitcode != 0 or not missing:
+            return (None, None, 0), []
+        stdout, _, exitcode = yield ['git', 'ls-tree', '-r', '-z', commit_hash], worktree
+        if exitcode != 0:
+            return (None, None, 0), []
+        excluded_paths = []
+        for entry in (stdout or '').split('\0'):
+            info, _, path = entry.partition('\t')
+            if path and info.split()[2] in missing:
+                excluded_paths.append(path)
+        if excluded_paths:
+            patterns = ['/*'] + ['!/' + re.sub(r'([\\*?\[])', r'\\\1', path) for path in excluded_paths]
+            result = yield ['git', 'sparse-checkout', 'set', '--no-cone'] + patterns, worktree
+            if result[2] != 0:
+                return result, []
+        return (None, None, 0), excluded_paths
+
+    def reset(self, commit_hash: str, dry_run: bool = False, checkout_workers: int = None):
+        return run_steps(self.reset_steps(commit_hash, dry_run, checkout_workers), trace=self.trace, env=self.git_env())
+
+    def reset_steps(self, commit_hash: str, dry_run: bool = False, checkout_workers: int = None):
+        """
+        Move the repo to commit_hash and write its working tree, using checkout_workers parallel checkout processes if given.
+        """
         self.status = RepoStatus.RESETTING
-        cmd = ['git', 'reset', '--hard', '-q', commit_hash]
+        cmd = ['git']
+        if checkout_workers is not None:
+            cmd.extend(['-c', f'checkout.workers={checkout_workers}'])
+        cmd.extend(['reset', '--hard', '-q', commit_hash])
         stdout, stderr, exitcode = None, None, 0
-        if not dry_run:
-            stdout, stderr, exitcode = run_cmd(cmd, cwd=self.local_path)
-        if exitcode == 0:
+        if not dry_run and self.shallow_since is not None:
+            yield from self.deepen_to_steps(commit_hash)
+        if not dry_run and self.sparse_paths:
+            stdout, stderr, exitcode = yield from self.sparse_checkout_steps()
+        if not dry_run and self.blob_limit and exitcode == 0:
+            (stdout, stderr, exitcode), self.truncated_paths = yield from self.exclude_missing_blobs_steps(commit_hash)
+        if not dry_run and exitcode == 0:
+            stdout, stderr, exitcode = yield cmd, self.local_path
+        if exitcode == 0 and self.truncated_paths:
+            self.status = RepoStatus.TRUNCATED
+        elif exitcode == 0:
             self.status = RepoStatus.RESET
         else:
             self.status = RepoStatus.RESET_ERROR
         return stdout, stderr, exitcode
 
-    def clone_and_reset(self, commit_hash, out_dir: Path | str, depth: int = None, single_branch: bool = True, dry_run: bool = False):
-        clone_stdout, clone_stderr, clone_exitcode = self.clone(out_dir, depth, single_branch, dry_run=dry_run)
+    def add_worktree_steps(self, commit_hash: str, path: Path | str, dry_run: bool = False, checkout_workers: int = None):
+        """
+        Write commit_hash into its own folder at path as a worktree of this clone, sharing all of its objects.
+        Returns the result of the checkout and the paths a size filtered clone left out of it.
+        """
+        if dry_run:
+            return (None, None, 0), []
+        path = Path(path).absolute()
+        if path.exists():
+            shutil.rmtree(path, onexc=onerror)
+        if self.shallow_since is not None:
+            yield from self.deepen_to_steps(commit_hash)
+        result = yield ['git', 'worktree', 'add', '-q', '-f', '--detach', '--no-checkout', str(path), commit_hash], self.local_path
+        if result[2] != 0:
+            return result, []
+        excluded_paths = []
+        if self.sparse_paths:
+            result = yield from self.sparse_checkout_steps(path)
+        if self.blob_limit and result[2] == 0:
+            result, excluded_paths = yield from self.exclude_missing_blobs_steps(commit_hash, path)
+        if result[2] != 0:
+            return result, []
+        cmd = ['git']
+        if checkout_workers is not None:
+            cmd.extend(['-c', f'checkout.workers={checkout_workers}'])
+        cmd.extend(['reset', '--hard', '-q', commit_hash])
+        result = yield cmd, path
+        return result, excluded_paths
+
+    def snapshot_steps(self, commit_hashes: list[str | None], out_dirs: list[Path], dry_run: bool = False, checkout_workers: int = None):
+        """
+        Check each commit out into the output folder at the same index as a worktree of this clone, skipping the ones that are None.
+        The first is the on time snapshot, it sets the repo status and local_path. snapshot_paths holds where the others were written, None if they were not.
+        """
+        self.status = RepoStatus.RESETTING
+        on_time_result = (None, None, 0)
+        self.snapshot_paths = []
+        self.truncated_paths = []
+        for i, (commit_hash, out_dir) in enumerate(zip(commit_hashes, out_dirs)):
+            path = Path(out_dir) / self.out_name
+            result = (None, None, -1)
+            if commit_hash is not None:
+                result, excluded_paths = yield from self.add_worktree_steps(commit_hash, path, dry_run, checkout_workers)
+                self.truncated_paths.extend(excluded_path for excluded_path in excluded_paths if excluded_path not in self.truncated_paths)
+            if i == 0:
+                on_time_result = result
+            else:
+                self.snapshot_paths.append(path if result[2] == 0 else None)
+
+        if commit_hashes[0] is None:
+            self.local_path = None
+            self.status = RepoStatus.COMMIT_NOT_FOUND
+        elif on_time_result[2] != 0:
+            self.status = RepoStatus.RESET_ERROR
+        else:
+            self.local_path = Path(out_dirs[0]) / self.out_name
+            self.status = RepoStatus.TRUNCATED if self.truncated_paths else RepoStatus.RESET
+        return on_time_result
+
+    def write_indexes(self):
+        return run_steps(self.write_indexes_steps())
+
+    def write_indexes_steps(self):
+        """
+        Write a commit-graph, with changed path filters for `git log -- <path>` and `git blame`, and a multi-pack-index into the repo,
+        so history queries do not have to parse every commit or search every pack. Shallow repos are skipped, git does not use a commit-graph in them.
+        """
+        stdout, stderr, exitcode = yield ['git', 'rev-parse', '--is-shallow-repository'], self.local_path
+        if exitcode != 0 or stdout == 'true':
+            return stdout, stderr, exitcode
+        stdout, stderr, exitcode = yield ['git', 'commit-graph', 'write', '--reachable', '--changed-paths'], self.local_path
+        if exitcode == 0:
+            stdout, stderr, exitcode = yield ['git', 'multi-pack-index', 'write'], self.local_path
+        self.indexed = exitcode == 0
+        return stdout, stderr, exitcode
+
+    def fetch_commit(self, commit_hash: str, out_dir: Path | str, strategy: CloneStrategy = CloneStrategy.SHALLOW, dry_run: bool = False, mirror_cache: MirrorCache = None, object_store: SharedObjectStore = None, blob_limit: int = None, sparse_paths: list[str] = None):
+        return run_steps(self.fetch_commit_steps(commit_hash, out_dir, strategy, dry_run, mirror_cache, object_store, blob_limit, sparse_paths), trace=self.trace, env=self.git_env())
+
+    def fetch_commit_steps(self, commit_hash: str, out_dir: Path | str, strategy: CloneStrategy = CloneStrategy.SHALLOW, dry_run: bool = False, mirror_cache: MirrorCache = None, object_store: SharedObjectStore = None, blob_limit: int = None, sparse_paths: list[str] = None):
+        """
+        Initialize an empty repo on the default branch and fetch only the due commit, `reset` then checks it out once.
+        If a mirror cache is given the commit is fetched from the updated local mirror instead of the remote.
+        With blob_limit files larger than blob_limit bytes are not downloaded and `reset` leaves them out.
+        With sparse_paths `reset` only checks out those folders and only their files are downloaded.
+        Falls back to a full clone if the server refuses to serve the commit directly.
+        """
+        self.status = RepoStatus.CLONING
+        clone_url = self.get_clone_url()
+        if clone_url is None:
+            self.status = RepoStatus.CLONE_ERROR
+            return None, None, -1
+        self.local_path = Path(out_dir) / self.out_name
+        branch = (self.repo_info or {}).get('default_branch', None) or 'main'
+        fetch_cmd = ['git', 'fetch', '-q']
+        if strategy == CloneStrategy.SHALLOW:
+            fetch_cmd.extend(['--depth', '1'])
+        if sparse_paths:
+            blob_limit = None  # every file outside the sparse folders is left out already, large or not
+        if sparse_paths and mirror_cache is None:
+            fetch_cmd.append('--filter=blob:none')
+        elif blob_limit and mirror_cache is None:
+            # replaces blob:none too, with every blob missing the large ones could not be told apart at reset
+            fetch_cmd.append(f'--filter=blob:limit={blob_limit}')
+        elif strategy == CloneStrategy.BLOBLESS and mirror_cache is None:
+            # blobs from a local mirror cost no network, and a filter would make the mirror a promisor remote
+            fetch_cmd.append('--filter=blob:none')
+        stdout, stderr, exitcode = None, None, 0
+        if not dry_run:
+            stdout, stderr, exitcode = yield ['git', 'init', '-q', '-b', branch, self.out_name], out_dir
+            if exitcode == 0 and object_store is not None:
+                object_store.seed([self.get_seed_clone_url(), clone_url])
+                object_store.link(self.local_path)
+            if exitcode == 0:
+                stdout, stderr, exitcode = yield ['git', 'remote', 'add', 'origin', clone_url], self.local_path
+            if exitcode == 0 and mirror_cache is None:
+                stdout, stderr, exitcode = yield fetch_cmd + ['origin', commit_hash], self.local_path
+            elif exitcode == 0:
+                with mirror_cache.lock(clone_url):
+                    mirror_path, (stdout, stderr, exitcode) = mirror_cache.update(clone_url)
+                    if exitcode == 0:
+                        stdout, stderr, exitcode = yield fetch_cmd + [mirror_path.as_uri(), commit_hash], self.local_path
+        if exitcode != 0:
+            if self.local_path.exists():
+                shutil.rmtree(self.local_path, onexc=onerror)
+            return (yield from self.clone_steps(out_dir, dry_run=dry_run, mirror_cache=mirror_cache, object_store=object_store, no_checkout=True, blob_limit=blob_limit, sparse_paths=sparse_paths))
+        if blob_limit and mirror_cache is None and not dry_run:
+            self.blob_limit = blob_limit
+        if sparse_paths and not dry_run:
+            self.sparse_paths = list(sparse_paths)
+        self.status = RepoStatus.CLONED
+        return stdout, stderr, exitcode
+
+    def fetch_and_checkout(self, commit_hash: str, out_dir: Path | str, strategy: CloneStrategy = CloneStrategy.SHALLOW, dry_run: bool = False, mirror_cache: MirrorCache = None):
+        clone_result = self.fetch_commit(commit_hash, out_dir, strategy, dry_run=dry_run, mirror_cache=mirror_cache)
+        if clone_result[2] != 0:
+            return clone_result, (None, None, None)
+        return clone_result, self.reset(commit_hash, dry_run=dry_run)
+
+    def clone_and_reset(self, commit_hash, out_dir: Path | str, depth: int = None, single_branch: bool = True, dry_run: bool = False, strategy: CloneStrategy = CloneStrategy.FULL, mirror_cache: MirrorCache = None):
+        if strategy != CloneStrategy.FULL:
+            return self.fetch_and_checkout(commit_hash, out_dir, strategy, dry_run=dry_run, mirror_cache=mirror_cache)
+        clone_stdout, clone_stderr, clone_exitcode = self.clone(out_dir, depth, single_branch, dry_run=dry_run, mirror_cache=mirror_cache)
         if clone_exitcode != 0:
             return (clone_stdout, clone_stderr, clone_exitcode), (None, None, None)
         reset_stdout, reset_stderr, reset_exitcode = self.reset(commit_hash, dry_run=dry_run)
         return (clone_stdout, clone_stderr, clone_exitcode), (reset_stdout, reset_stderr, reset_exitcode)
 
+    def fetch_update(self, commit_hash: str | None, out_dir: Path | str, dry_run: bool = False):
+        return run_steps(self.fetch_update_steps(commit_hash, out_dir, dry_run), trace=self.trace, env=self.git_env())
+
+    def fetch_update_steps(self, commit_hash: str | None, out_dir: Path | str, dry_run: bool = False):
+        """
+        Fetch commit_hash into a repo already cloned in out_dir, `reset` then moves it there.
+        Marks the repo Up To Date instead if HEAD already matches.
+        If commit_hash is None the latest commit on the remote default branch is used.
+        """
+        self.local_path = Path(out_dir) / self.out_name
+        clone_url = self.get_clone_url()
+        if clone_url is None:
+            self.status = RepoStatus.CLONE_ERROR
+            return None, None, -1
+        if dry_run:
+            self.status = RepoStatus.CLONED
+            return None, None, 0
+
+        head, _, _ = yield ['git', 'rev-parse', 'HEAD'], self.local_path
+        if commit_hash is not None and head == commit_hash:
+            self.status = RepoStatus.UP_TO_DATE
+            return None, None, 0
+
+        self.status = RepoStatus.CLONING
+        yield ['git', 'remote', 'set-url', 'origin', clone_url], self.local_path  # token may have changed since the last run
+        fetch_cmd = ['git', 'fetch', '-q']
+        if (self.local_path / '.git' / 'shallow').exists():
+            fetch_cmd.extend(['--depth', '1'])
+        fetch_cmd.extend(['origin', commit_hash if commit_hash is not None else 'HEAD'])
+        stdout, stderr, exitcode = yield fetch_cmd, self.local_path
+        if exitcode != 0:
+            self.status = RepoStatus.CLONE_ERROR
+            return stdout, stderr, exitcode
+
+        self.commit_hash = commit_hash
+        if commit_hash is None:
+            self.commit_hash, _, _ = yield ['git', 'rev-parse', 'FETCH_HEAD'], self.local_path
+        self.status = RepoStatus.UP_TO_DATE if head == self.commit_hash else RepoStatus.CLONED
+        return stdout, stderr, exitcode
+
+    def download(self, commit_hash: str | None, out_dir: Path | str, dry_run: bool = False):
+        """
+        Write the files at commit_hash into out_dir from the repo archive, no git repo is created.
+        If commit_hash is None the archive of the default branch is used.
+        """
+        self.status = RepoStatus.CLONING
+        self.local_path = Path(out_dir) / self.out_name
+        if dry_run:
+            self.status = RepoStatus.DOWNLOADED
+            return None, None, 0
+        if self.local_path.exists():
+            shutil.rmtree(self.local_path, onexc=onerror)
+        stdout, stderr, exitcode = self.api_client.download_archive(self, commit_hash, self.local_path)
+        if exitcode == 0:
+            self.status = RepoStatus.DOWNLOADED
+        else:
+            self.status = RepoStatus.CLONE_ERROR
+        return stdout, stderr, exitcode
+
+    def refresh(self, commit_hash: str | None, out_dir: Path | str, dry_run: bool = False):
+        """
+        Bring a repo already cloned in out_dir to commit_hash without recloning it.
+        """
+        fetch_result = self.fetch_update(commit_hash, out_dir, dry_run=dry_run)
+        if self.status != RepoStatus.CLONED:
+            return fetch_result, (None, None, 0 if self.status == RepoStatus.UP_TO_DATE else None)
+        return fetch_result, self.reset(self.commit_hash, dry_run=dry_run)
+
     def get_name(self):
         raise NotImplementedError()
 
+    def debug_state(self) -> dict:
+        """
+        Shallow copy of the repo's fields for the debug log, without the api client every repo shares
+        """
+        state = dict(vars(self))
+        state.pop('api_client', None)
+        return state
+
     def get_clone_url(self):
+        """
+        Url git clones and fetches from, the local caching proxy while the run has one
+        """
+        return self.transport_url(self.get_upstream_clone_url())
+
+    def get_upstream_clone_url(self):
         raise NotImplementedError()
 
+    def transport_url(self, clone_url: str | None) -> str | None:
+        """
+        Opens the shared ssh connection to clone_url's host if it is the first one, and routes clone_url through the proxy if the run has one
+        """
+        if self.api_client.ssh is not None and clone_url is not None:
+            self.api_client.ssh.connect(clone_url)
+        git_proxy = self.api_client.git_proxy
+        if git_proxy is None or clone_url is None:
+            return clone_url
+        return git_proxy.register(clone_url, self.proxy_fresh_after, (self.repo_info or {}).get('default_branch', None))
+
+    def git_env(self) -> dict | None:
+        """
+        Environment for the repo's git commands, None to inherit this process's
+        """
+        return self.api_client.ssh.git_env() if self.api_client.ssh is not None else None
+
+    def unproxy_remote(self, local_path: Path | str = None, policy: GitRetryPolicy = None):
+        """
+        Point origin back at upstream once the proxy the repo was cloned through stops, so later fetches and partial clone downloads still work
+        """
+        return run_limited_cmd(['git', 'remote', 'set-url', 'origin', self.get_upstream_clone_url()], local_path if local_path is not None else self.local_path, policy=policy)
+
+    def get_size(self) -> int:
+        """
+        Repo size in bytes as reported by the API, 0 if unknown
+        """
+        raise NotImplementedError()
+
+    def get_seed_clone_url(self):
+        """
+        Url of the repo the student repo was generated from, used to seed a shared object store
+        """
+        return self.get_clone_url()
+
 
 class GitHubRepo(GitRepo):
     def get_name(self):
         return f'{self.prefix}-{self.username}'
 
-    def get_clone_url(self):
-        return self.repo_info.get('clone_url', None).replace('https://', f'https://{self.api_client.access_token}@')
+    def get_upstream_clone_url(self):
+        return self.upstream_url(self.repo_info)
+
+    def upstream_url(self, repo_info: dict) -> str | None:
+        if self.api_client.ssh is not None:
+            return repo_info.get('ssh_url', None)
+        return repo_info.get('clone_url', None).replace('https://', f'https://{self.api_client.access_token}@')
+
+    def get_seed_clone_url(self):
+        template_info = self.repo_info.get('template_repository', None)
+        if not template_info:
+            return self.get_clone_url()
+        return self.transport_url(self.upstream_url(template_info))
+
+    def get_size(self) -> int:
+        return ((self.repo_info or {}).get('size', None) or 0) * 1024  # GitHub reports KB
 
 
 class GitLabRepo(GitRepo):
     def get_name(self):
         return f'{self.real_name.replace("-", "_")}/{self.prefix}'
 
-    def get_clone_url(self):
-        return self.repo_info.get('http_url_to_repo', None).replace('https://', f'https://oauth2:{self.api_client.access_token}@')
-        # return self.repo_info.get('ssh_url_to_repo', None)
+    def get_upstream_clone_url(self):
+        return self.upstream_url(self.repo_info)
+
+    def upstream_url(self, repo_info: dict) -> str | None:
+        if self.api_client.ssh is not None:
+            return repo_info.get('ssh_url_to_repo', None)
+        return repo_info.get('http_url_to_repo', None).replace('https://', f'https://oauth2:{self.api_client.access_token}@')
+
+    def get_seed_clone_url(self):
+        forked_info = self.repo_info.get('forked_from_project', None)
+        if not forked_info:
+            return self.get_clone_url()
+        return self.transport_url(self.upstream_url(forked_info))
+
+    def get_size(self) -> int:
+        # only present once `GitLabAPIClient.get_repo_size` fetched the project with statistics
+        return (((self.repo_info or {}).get('statistics', None) or {}).get('repository_size', None) or 0)
 
 
 class GitHubAPIClient(APIClient):
@@ -474,18 +1152,15 @@ class GitHubAPIClient(APIClient):
             return  # required to exit generator
         yield items
 
-        # Get remaining pages
-        with ThreadPoolExecutor(max_workers=(os.cpu_count() * 1.25) if not self.debug else 1) as executor:
-            futures = [executor.submit(self.get_page_by_number, base_url, params, page) for page in range(2, last_page + 1)]
-            for future in as_completed(futures):
-                response = future.result()
-                data = jsonbackend.loads(response.content)
-                items = None
-                if isinstance(data, dict):
-                    items = data.get('items', [])
-                elif isinstance(data, list):
-                    items = data
-                yield items
+        # Get remaining pages, the ones not requested yet are cancelled if the caller stops early
+        for response in self.scheduler.map_unordered(partial(self.get_page_by_number, base_url, params), range(2, last_page + 1), priority=PRIORITY_PAGE):
+            data = jsonbackend.loads(response.content)
+            items = None
+            if isinstance(data, dict):
+                items = data.get('items', [])
+            elif isinstance(data, list):
+                items = data
+            yield items
 
     def get_commit_before_by_pushes(self, datetime: datetime, pushes: dict) -> str:
         for push in pushes:
@@ -540,6 +1215,32 @@ class GitHubAPIClient(APIClient):
         except Exception as _:
             repo.status = RepoStatus.ACTIVITY_ERROR
 
+    def get_commits_before_by_repo(self, datetimes: list[datetime], repo: 'GitHubRepo') -> list[str | None]:
+        try:
+            if repo.status != RepoStatus.RETRIEVED:
+                return [None] * len(datetimes)
+            repo.status = RepoStatus.CHECKING_COMMITS
+            params = dict(self.push_params)
+            url = f'{repo.repo_info["url"]}/activity'
+            pushes = [push for page in self.fetch_all_pages(url, params) for push in page]
+            # pages arrive in completion order, put them back newest first
+            pushes.sort(key=lambda push: push['timestamp'], reverse=True)
+            commit_hashes = [self.get_commit_before_by_pushes(due_datetime, pushes) for due_datetime in datetimes]
+            if any(commit_hashes):
+                repo.status = RepoStatus.COMMIT_FOUND
+            elif not pushes:
+                repo.status = RepoStatus.NO_COMMITS
+            else:
+                repo.status = RepoStatus.COMMIT_NOT_FOUND
+            return commit_hashes
+        except Exception as _:
+            repo.status = RepoStatus.ACTIVITY_ERROR
+            return [None] * len(datetimes)
+
+    def get_archive_request(self, repo: 'GitHubRepo', commit_hash: str | None) -> tuple[str, dict]:
+        # no ref means the default branch, the api redirects to codeload which serves the tarball
+        return f'{repo.repo_info["url"]}/tarball/{commit_hash or ""}'.rstrip('/'), {}
+
     def get_repo(self, repo: GitRepo) -> dict:
         import orjson as jsonbackend
 
@@ -565,11 +1266,8 @@ class GitHubAPIClient(APIClient):
         import orjson as jsonbackend
 
         base_url = f'https://api.github.com/repos/{self.organization}/'
-        with ThreadPoolExecutor(max_workers=(os.cpu_count() * 1.25) if not self.debug else 1) as executor:
-            futures = {executor.submit(self.sync_request, f'{base_url}{repo_prefix}-{username}', {}): username for username in usernames}
-            for future in as_completed(futures):
-                response = future.result()
-                yield response.status_code, jsonbackend.loads(response.content)
+        for response in self.scheduler.map_unordered(lambda username: self.sync_request(f'{base_url}{repo_prefix}-{username}', {}), usernames):
+            yield response.status_code, jsonbackend.loads(response.content)
 
 
 class GitLabAPIClient(APIClient):
@@ -664,6 +1362,66 @@ class GitLabAPIClient(APIClient):
         except Exception as _:
             repo.status = RepoStatus.ACTIVITY_ERROR
 
+    def get_commits_before_by_repo(self, datetimes: list[datetime], repo: 'GitLabRepo') -> list[str | None]:
+        """
+        The events api filters by day, so each datetime still needs its own page, but the push check is shared
+        """
+        try:
+            if repo.status != RepoStatus.RETRIEVED:
+                return [None] * len(datetimes)
+            repo.status = RepoStatus.CHECKING_COMMITS
+            params = dict(self.push_params)
+
+            repo_id = repo.repo_info.get('id', None)
+            url = f'{self.server_url}/api/v4/projects/{repo_id}/events'
+            response = self.sync_request(url, params)
+            if response.status_code != 200:
+                repo.status = RepoStatus.ACTIVITY_ERROR
+                return [None] * len(datetimes)
+            if not response.json():
+                repo.status = RepoStatus.NO_COMMITS
+                return [None] * len(datetimes)
+
+            commit_hashes = []
+            for in_datetime in datetimes:
+                params['before'] = (in_datetime + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+                response = self.sync_request(url, params)
+                if response.status_code != 200:
+                    repo.status = RepoStatus.ACTIVITY_ERROR
+                    return [None] * len(datetimes)
+                pushes = response.json()
+                if not pushes or 'created_at' not in pushes[0] or datetime.fromisoformat(pushes[0]['created_at'].replace("Z", "+00:00")).replace(tzinfo=None) >= in_datetime:
+                    commit_hashes.append(None)
+                else:
+                    commit_hashes.append(pushes[0]['push_data']['commit_to'])
+            repo.status = RepoStatus.COMMIT_FOUND if any(commit_hashes) else RepoStatus.COMMIT_NOT_FOUND
+            return commit_hashes
+        except Exception as _:
+            repo.status = RepoStatus.ACTIVITY_ERROR
+            return [None] * len(datetimes)
+
+    def get_repo_size(self, repo: 'GitLabRepo') -> int:
+        # group search results leave statistics out, only the project itself has them
+        if 'statistics' not in repo.repo_info:
+            import orjson as jsonbackend
+
+            repo_id = repo.repo_info.get('id', None)
+            statistics = {}
+            try:
+                response = self.sync_request(f'{self.server_url}/api/v4/projects/{repo_id}', {'statistics': 'true'})
+                if response.status_code == 200:
+                    # statistics need at least Reporter access to the project, without it they are left out again
+                    statistics = jsonbackend.loads(response.content).get('statistics', None) or {}
+            except Exception as e:
+                self.log_handler.error(f'Unable to get statistics of project {repo_id}: {e!r}', self)
+            repo.repo_info['statistics'] = statistics
+        return repo.get_size()
+
+    def get_archive_request(self, repo: 'GitLabRepo', commit_hash: str | None) -> tuple[str, dict]:
+        repo_id = repo.repo_info.get('id', None)
+        params = {'sha': commit_hash} if commit_hash else {}
+        return f'{self.server_url}/api/v4/projects/{repo_id}/repository/archive.tar.gz', params
+
     def get_repo(self, repo: GitRepo) -> dict:
         import orjson as jsonbackend
         # repo.prefix
@@ -786,13 +1544,18 @@ def get_repo_prefix(client: GitHubAPIClient, prev_repo_prefix: str) -> str:
         return repo_prefix
 
 
-def create_vscode_workspace(parent_folder_path, repo_prefix, repos: list[GitHubRepo]):
+def create_vscode_workspace(parent_folder_path, repo_prefix, repos: list[GitHubRepo], out_names: list[str] = None):
+    """
+    Workspace with every repo cloned into parent_folder_path, or only the repos in out_names if given
+    """
     workspace_path = Path(parent_folder_path) / f'{repo_prefix}.code-workspace'
     with open(workspace_path, 'w') as f:
         f.write('{\n')
         f.write('    "folders": [\n')
         for repo in sorted(repos, key=lambda x: x.out_name):
-            if repo.status != RepoStatus.CLONED_DONE and repo.status != RepoStatus.RESET:
+            if out_names is not None and repo.out_name not in out_names:
+                continue
+            if out_names is None and repo.status not in (RepoStatus.CLONED_DONE, RepoStatus.RESET, RepoStatus.UP_TO_DATE, RepoStatus.DOWNLOADED, RepoStatus.TRUNCATED):
                 continue
             val = repo.out_name
             f.write(f'        {{ "path": "{val}" }},\n')
@@ -802,11 +1565,13 @@ def create_vscode_workspace(parent_folder_path, repo_prefix, repos: list[GitHubR
 
 
 def extract_data_folder(initial_path, data_folder_name='data'):
-    repos = os.listdir(initial_path)
+    repos = [folder for folder in os.listdir(initial_path) if folder not in (data_folder_name, OBJECT_STORE_NAME) and (Path(initial_path) / folder).is_dir()]
+    if not repos:
+        return
     repo_to_check = repos[len(repos) - 1]
     folders = os.listdir(Path(initial_path) / repo_to_check)
     if data_folder_name in folders:
-        shutil.copytree(f'{str(Path(initial_path) / repo_to_check / data_folder_name)}', f'{str(Path(initial_path) / data_folder_name)}')
+        shutil.copytree(f'{str(Path(initial_path) / repo_to_check / data_folder_name)}', f'{str(Path(initial_path) / data_folder_name)}', dirs_exist_ok=True)
         print(
             f'{LIGHT_GREEN}Data folder extracted to the output directory.{WHITE}',
         )
@@ -847,6 +1612,38 @@ def print_pull_report(students, num_repos, num_not_accepted, num_no_commits, num
     return full_report_str
 
 
+def print_oversized_report(repos: list[GitRepo], size_limit: int, max_name_len: int, max_user_len: int) -> str:
+    """
+    List the repos over the preset size limit and how many files were left out of each, so they can be checked by hand
+    """
+    oversized = [repo for repo in repos if repo.oversized]
+    lines = [f'{YELLOW}{len(oversized)} repos are over the {size_limit} MB size limit:{WHITE}']
+    for repo in oversized:
+        info = format_bytes(repo.get_size())
+        if repo.truncated_paths:
+            info += f', {len(repo.truncated_paths)} large files left out: {", ".join(repo.truncated_paths)}'
+        lines.append(f'  > {build_repo_and_info_str(repo, info, max_name_len, max_user_len, color=YELLOW)}')
+    if any(repo.truncated_paths for repo in oversized):
+        lines.append(f'{CYAN}Run `git sparse-checkout disable` in a repo to download the files left out of it.{WHITE}')
+    print('\n'.join(lines))
+    print()
+    return '\n' + '\n'.join(lines)
+
+
+def print_snapshot_report(repos: list[GitRepo], extra_deadlines: list[int], snapshot_dirs: list[Path]) -> str:
+    """
+    How many repos had a commit to snapshot at each late deadline and where they were written
+    """
+    lines = []
+    for i, (hours, snapshot_dir) in enumerate(zip(extra_deadlines, snapshot_dirs)):
+        num_snapshots = sum(1 for repo in repos if len(repo.snapshot_paths) > i and repo.snapshot_paths[i] is not None)
+        num_late = sum(1 for repo in repos if len(repo.snapshot_paths) > i and repo.snapshot_paths[i] is not None and repo.commit_hash != repo.snapshot_commits[i])
+        lines.append(f'{LIGHT_GREEN}+{hours}h: {num_snapshots} snapshots ({num_late} changed since the due datetime) in {snapshot_dir}{WHITE}')
+    print('\n'.join(lines))
+    print()
+    return '\n' + '\n'.join(lines)
+
+
 def get_time():
     """
     Get assignment due time from input.
@@ -901,11 +1698,10 @@ def build_repo_and_info_str(repo: GitRepo, info: str, max_name_len: int, max_use
     return f'{color}{repo.real_name.ljust(max_name_len)} : {repo.username.ljust(max_user_len)} : {info}{WHITE}'
 
 
-def get_repos_info(repos: list[GitRepo], debug: bool = False):
-    with ThreadPoolExecutor(max_workers=(os.cpu_count() * 1.25) if not debug else 1) as executor:
-        futures = [executor.submit(repo.get_info) for repo in repos]
-        for future in as_completed(futures):
-            yield future.result()
+def get_repos_info(repos: list[GitRepo]):
+    if not repos:
+        return
+    yield from repos[0].api_client.scheduler.map_unordered(GitRepo.get_info, repos)
 
 
 def print_and_log(message, prints_log):
@@ -913,18 +1709,58 @@ def print_and_log(message, prints_log):
     print(message)
 
 
-def save_report(report, config_manager):
-    clone_logs = config_manager.config.clone_history
-    clone_logs.append(report)
-    if len(clone_logs) > 8:
-        clone_logs = clone_logs[1:]
-    config_manager.set_config_value('clone_history', clone_logs)
+def save_report(report, config_manager, replace=None):
+    with REPORT_LOCK:  # assignments in a batch finish on their own threads
+        clone_logs = config_manager.config.clone_history
+        if replace is not None and replace in clone_logs:
+            clone_logs[clone_logs.index(replace)] = report
+        else:
+            clone_logs.append(report)
+        if len(clone_logs) > 8:
+            clone_logs = clone_logs[1:]
+        config_manager.set_config_value('clone_history', clone_logs)
+
+
+def make_git_limiter() -> AdaptiveLimiter:
+    return AdaptiveLimiter('Git clones', int((os.cpu_count() or 1) * 1.5), max_limit=DEFAULT_MAX_GIT_PROCESSES)
+
+
+def make_checkout_limiter() -> AdaptiveLimiter:
+    # checkouts are bound by disk writes, latency growing under load keeps slow disks from being flooded
+    return AdaptiveLimiter('Checkouts', 2, max_limit=os.cpu_count() or 1)
+
+
+def make_io_scheduler() -> IOScheduler:
+    # enough threads for every API request, git process and checkout the limiters can allow at once, however many assignments share it
+    max_workers = MAX_API_REQUESTS + DEFAULT_MAX_GIT_PROCESSES + (os.cpu_count() or 1)
+    return IOScheduler('io', max_workers, make_git_limiter(), make_checkout_limiter())
+
 
+def make_git_proxy(config, policy: GitRetryPolicy, env: dict = None) -> GitCacheProxy:
+    # the clone a refresh is serving already holds a git slot, refreshes only get timeouts and retries so a full limiter cannot deadlock
+    proxy = GitCacheProxy(MirrorCache(config.mirror_cache_dir or None, policy=policy, env=env), config.git_proxy_refresh_seconds, port=config.git_proxy_port)
+    proxy.start()
+    return proxy
 
-def main(preset=None, dry_run=None, config_manager=None):
+
+def make_ssh_multiplexer(config) -> SshMultiplexer:
+    return SshMultiplexer(config.ssh_control_persist)
+
+
+def main(preset=None, dry_run=None, config_manager=None, retry_report=None, batch_entry=None, batch=None):
+    """
+    Clone all student repos for an assignment.
+    If retry_report is given only the repos that failed in that run are cloned again, into the same folder at the same due datetime.
+    batch_entry gives the assignment and due datetime of one clone in a batch, batch holds the client, limiters and engine the batch shares.
+    """
     gc.disable()
     log_handler = None
     client = None
+    clone_engine = None
+    git_proxy = None
+    ssh = None
+    trace_dir = None
+    journal = None
 
     start_1 = perf_counter()
     prints_log = []
@@ -934,6 +1770,10 @@ def main(preset=None, dry_run=None, config_manager=None):
     default_clone_source = config_manager.config.default_clone_source
     stop_1 = perf_counter()
     try:
+        if batch_entry is not None:
+            preset = batch_entry.preset
+        if retry_report is not None:
+            preset = ClonePreset('', '', retry_report.due_time, retry_report.student_csv, False, retry_report.clone_type or None, retry_report.clone_source, retry_report.clone_strategy, getattr(retry_report, 'size_limit', 0), getattr(retry_report, 'blob_limit', 0), getattr(retry_report, 'extra_deadlines', ()), getattr(retry_report, 'sparse_paths', ()))
         if preset is None:
             preset = ClonePreset('', '', '', students_path, False, (0, 0, 0), default_clone_source)
             preset.append_timestamp = bool_prompt(
@@ -973,15 +1813,55 @@ def main(preset=None, dry_run=None, config_manager=None):
         access_token = config_manager.config.github_token if clone_source == "GitHub" else config_manager.config.gitlab_token
         organization = config_manager.config.github_organization if clone_source == "GitHub" else config_manager.config.gitlab_organization
         delete_duplicates = config_manager.config.replace_clone_duplicates
-
+        update_in_place = delete_duplicates and config_manager.config.update_clone_in_place
+        clone_strategy = CloneStrategy.from_str(preset.clone_strategy)
 
         log_handler = LogHandler(LogLevel.DEBUG if debug else LogLevel.CRITICAL)
         log_handler.censored_strs.append(access_token)
-        client = client_type(config_manager.config, log_handler)
+        client = client_type(config_manager.config, log_handler) if batch is None else batch.get_client(client_type)
+        # the client's scheduler holds the limits every stage (and every assignment of a batch) shares
+        git_limiter = client.scheduler.git_limiter
+        checkout_limiter = client.scheduler.checkout_limiter
+        retry_policy = GitRetryPolicy.from_config(config_manager.config) if batch is None else batch.retry_policy
+        use_archive = clone_strategy == CloneStrategy.ARCHIVE
+        # archives are plain http downloads through the api session, there are no git processes for the engine to run
+        if batch is not None:
+            clone_engine = batch.clone_engine if not use_archive else None
+        elif config_manager.config.clone_engine == 'Asyncio' and not use_archive:
+            clone_engine = AsyncCloneEngine(limiter=git_limiter, policy=retry_policy)
+        defer_checkout = config_manager.config.defer_checkout
+        index_repos = config_manager.config.index_cloned_repos and not dry_run
+        index_seconds = []
+        unknown_sizes = []
+        # git writes trace2 events only for commands that run, a dry run has nothing to trace
+        trace_dir = Path(tempfile.mkdtemp(prefix='gcis-trace-')) if config_manager.config.trace_git_phases and not use_archive and not dry_run else None
+        history_window = timedelta(days=config_manager.config.history_window_days) if config_manager.config.trim_clone_history else None
+        size_limit = (preset.size_limit or 0) * 1024 * 1024
+        blob_limit = (preset.blob_limit or 0) * 1024 * 1024 or None
+        if batch is None and config_manager.config.git_transport == 'SSH' and not use_archive:
+            client.ssh = ssh = make_ssh_multiplexer(config_manager.config)
+        elif batch is not None:
+            ssh = client.ssh
+        # only the git commands of this run use its ssh connections, other runs of a batch and other git the app starts are left alone
+        git_env = ssh.git_env() if ssh is not None else None
+        if batch is None and config_manager.config.use_git_proxy and not use_archive:
+            client.git_proxy = git_proxy = make_git_proxy(config_manager.config, retry_policy, git_env)
+        elif batch is not None:
+            git_proxy = client.git_proxy
+        # clones through the proxy already come from its mirrors
+        mirror_cache = MirrorCache(config_manager.config.mirror_cache_dir or None, git_limiter, retry_policy, git_env) if config_manager.config.use_mirror_cache and git_proxy is None else None
+        api_calls_start = client.request_limiter.num_calls
+        # the connections and the git limiter are shared by a batch, this run counts the clones and fetches of its own repos, through a proxy they do not use ssh
+        ssh_commands = SshCommandCounter() if ssh is not None and git_proxy is None else None
         stop_2 = perf_counter()
 
         prev_repo_prefix = '' if not config_manager.config.clone_history else config_manager.config.clone_history[-1].assignment_name
-        repo_prefix = get_repo_prefix(client, prev_repo_prefix)
+        if retry_report is not None:
+            repo_prefix = retry_report.assignment_name
+        elif batch_entry is not None:
+            repo_prefix = batch_entry.repo_prefix
+        else:
+            repo_prefix = get_repo_prefix(client, prev_repo_prefix)
         if repo_prefix == 'quit()':
             return
 
@@ -1007,11 +1887,11 @@ def main(preset=None, dry_run=None, config_manager=None):
                     flags = (0, 0, 1)
             hours_adjust = 0
             if flags[0]:
-                hours_adjust = param.class_activity_hours
+                hours_adjust = param.class_activity_adj
             elif flags[1]:
-                hours_adjust = param.assignment_hours
+                hours_adjust = param.assignment_adj
             elif flags[2]:
-                hours_adjust = param.exam_hours
+                hours_adjust = param.exam_adj
             students_adjust[param.github] = hours_adjust
 
         current_pull = False
@@ -1023,8 +1903,16 @@ def main(preset=None, dry_run=None, config_manager=None):
             log_handler.info(f'Dry Run: {dry_run}')
             log_handler.info(f'Current Pull: {current_pull}')
             log_handler.info(f'Delete Duplicates: {delete_duplicates}')
+            log_handler.info(f'Update In Place: {update_in_place}')
             log_handler.info(f'Append Timestamp: {append_timestamp}')
             log_handler.info(f'Folder Suffix: {folder_suffix}')
+            log_handler.info(f'Clone Strategy: {clone_strategy.value}')
+            log_handler.info(f'Mirror Cache: {mirror_cache.root if mirror_cache is not None else None}')
+            log_handler.info(f'Clone Engine: {config_manager.config.clone_engine}')
+            log_handler.info(f'Defer Checkout: {defer_checkout}')
+            log_handler.info(f'History Window: {history_window}')
+            log_handler.info(f'Size Limit: {preset.size_limit} MB, Blob Limit: {preset.blob_limit} MB')
+            log_handler.info(f'Sparse Folders: {preset.sparse_paths}')
             log_handler.info(f'Students: {students}')
 
         max_name_len = max([len(students[student]) for student in students])
@@ -1033,12 +1921,18 @@ def main(preset=None, dry_run=None, config_manager=None):
         due_date = ''
         due_time = ''
         time_is_current = False
-        if not preset.clone_time:
-            time_is_current, due_time = get_time()
+        date_is_current = False
+        if retry_report is not None:
+            due_date, due_time = retry_report.due_date, retry_report.due_time
+            current_pull = retry_report.current_pull
+        elif batch_entry is not None:
+            due_date, due_time = batch_entry.due_date, batch_entry.due_time
         else:
-            due_time = preset.clone_time
-
-        date_is_current, due_date = get_date()
+            if not preset.clone_time:
+                time_is_current, due_time = get_time()
+            else:
+                due_time = preset.clone_time
+            date_is_current, due_date = get_date()
 
         if date_is_current and time_is_current:
             current_pull = True
@@ -1063,10 +1957,46 @@ def main(preset=None, dry_run=None, config_manager=None):
             time_str = due_time.replace(':', '_')
             folder_suffix += f'_{date_str}_{time_str}'
 
+        # late deadlines are snapshots of the same clone, they need its history and a deadline to be late to
+        extra_deadlines = sorted({int(hours) for hours in (preset.extra_deadlines or ()) if int(hours) > 0}) if not current_pull else []
+        if extra_deadlines and use_archive:
+            print_and_log(f'{LIGHT_RED}[WARNING]: Late deadline snapshots need git history, they are skipped with the Archive strategy.{WHITE}', prints_log)
+            extra_deadlines = []
+        if extra_deadlines:
+            update_in_place = False  # snapshots are fresh worktrees of a fresh clone
+        sparse_paths = list(preset.sparse_paths or ())
+        if sparse_paths and use_archive:
+            print_and_log(f'{LIGHT_RED}[WARNING]: Sparse folders need a git clone, the whole repo is downloaded with the Archive strategy.{WHITE}', prints_log)
+            sparse_paths = []
+
         start_3 = perf_counter()
         out_dir = Path(f'{config_manager.config.out_dir}/{repo_prefix}{folder_suffix}')
-        if out_dir.exists() and not delete_duplicates:
+        run_info = {'prefix': repo_prefix, 'due': due_datetime.isoformat(), 'current_pull': current_pull, 'strategy': clone_strategy.value}
+        if extra_deadlines:
+            run_info['extra_deadlines'] = extra_deadlines
+        if sparse_paths:
+            run_info['sparse_paths'] = sparse_paths
+        resume = False
+        if not dry_run and retry_report is None:
+            journal = RunJournal.find_unfinished(out_dir, run_info)
+            # a batch runs unattended, it always picks up where an interrupted batch stopped
+            resume = journal is not None and (batch is not None or bool_prompt(f'An interrupted clone into {journal.out_dir} was found. Resume it?', True))
+            if resume:
+                out_dir = journal.out_dir
+            else:
+                journal = RunJournal(out_dir)
+        if retry_report is not None:
+            out_dir = Path(retry_report.out_dir)
+            print_and_log(f'{CYAN}[INFO]: Retrying failed repos in {out_dir}.{WHITE}', prints_log)
+            if not dry_run:
+                os.makedirs(out_dir, exist_ok=True)
+        elif resume:
+            print_and_log(f'{CYAN}[INFO]: Resuming interrupted clone in {out_dir}.{WHITE}', prints_log)
+        elif out_dir.exists() and not delete_duplicates:
             out_dir = make_unique_path(out_dir)
+            journal = RunJournal(out_dir) if journal is not None else None
+        elif out_dir.exists() and update_in_place:
+            print_and_log(f'{CYAN}[INFO]: Updating repos already cloned in {out_dir}.{WHITE}', prints_log)
         elif out_dir.exists() and delete_duplicates:
             if debug:
                 log_handler.info(f'Deleting files in {out_dir}')
@@ -1077,9 +2007,47 @@ def main(preset=None, dry_run=None, config_manager=None):
                 print_and_log(f'{CYAN}[INFO]: Deleted {num_files_deleted} files/folders in {out_dir}.{WHITE}', prints_log)
         elif not dry_run:
             os.makedirs(out_dir)
+        previous_repos = {}
+        if resume:
+            previous_repos = journal.load()
+        elif retry_report is not None:
+            for out_name, status, commit_hash, *snapshots in retry_report.repo_outcomes:
+                # reports saved before late deadline snapshots were kept only have the first three
+                snapshot_commits, snapshot_paths = snapshots if snapshots else ((), ())
+                previous_repos[out_name] = {'status': status, 'commit': commit_hash, 'snapshot_commits': list(snapshot_commits), 'snapshot_paths': list(snapshot_paths)}
+        if journal is not None:
+            journal.open(run_info, resume=resume)
+
+        object_store = SharedObjectStore(out_dir, git_limiter, retry_policy, git_env) if config_manager.config.share_run_objects and not dry_run else None
+
+        snapshot_dirs = []
+        snapshot_store = None
+        if extra_deadlines:
+            # each late deadline gets its own output folder, the clones they are all worktrees of live in a hidden folder next to them
+            snapshot_store = out_dir.with_name(f'.{out_dir.name}.snapshots')
+            for i, hours in enumerate(extra_deadlines):
+                snapshot_dir = out_dir.with_name(f'{out_dir.name}_{hours}h_late')
+                if retry_report is not None and i < len(getattr(retry_report, 'snapshot_dirs', ())):
+                    snapshot_dir = Path(retry_report.snapshot_dirs[i])
+                elif resume:
+                    pass
+                elif snapshot_dir.exists() and not delete_duplicates:
+                    snapshot_dir = make_unique_path(snapshot_dir)
+                elif snapshot_dir.exists():
+                    delete_files_in_dir(snapshot_dir, dry_run)
+                if not dry_run:
+                    os.makedirs(snapshot_dir, exist_ok=True)
+                snapshot_dirs.append(snapshot_dir)
+            if not dry_run and not resume and retry_report is None and snapshot_store.exists():
+                shutil.rmtree(snapshot_store, onexc=onerror)
+            if not dry_run:
+                os.makedirs(snapshot_store, exist_ok=True)
 
         if debug:
             log_handler.info(f'Output directory: {out_dir}')
+            log_handler.info(f'Shared Object Store: {object_store.path if object_store is not None else None}')
+            log_handler.info(f'Run Journal: {journal.path if journal is not None else None}, resumed={resume}')
+            log_handler.info(f'Late Deadlines: {extra_deadlines}, Snapshot Folders: {snapshot_dirs}')
             log_handler.open(f'{out_dir}/log.txt')
             log_handler._flush()
 
@@ -1092,70 +2060,253 @@ def main(preset=None, dry_run=None, config_manager=None):
         num_no_commit = 0
         num_cloned = 0
         num_reset = 0
-        skip_flag = True
         pull_start = perf_counter()
         repos = [repo_type(client, prefix=repo_prefix, username=student_username, real_name=students[student_username]) for student_username in students]
         repos_created = True
         for repo in repos:
             if repo.username in students_adjust:
-                repo.hours_adjust = students_adjust[repo.username]
+                repo.hours_adjust = timedelta(hours=float(students_adjust[repo.username]))
+            if trace_dir is not None:
+                repo.trace = GitTrace(trace_dir)
+            if not current_pull:
+                # the proxy refreshes a mirror last fetched before the repo's latest deadline
+                repo.proxy_fresh_after = due_datetime + repo.hours_adjust + timedelta(hours=max(extra_deadlines, default=0))
+            # repos finished by an interrupted run or the run being retried are kept as they are
+            state = previous_repos.get(repo.out_name, None)
+            repo_exists = (out_dir / repo.out_name).exists()
+            if state is not None and state.get('status', None) in RESUMABLE_DONE_STATUSES and (repo_exists or state['status'] not in RESUMABLE_CLONED_STATUSES):
+                repo.status = RepoStatus[state['status']]
+                repo.commit_hash = state.get('commit', None)
+                repo.local_path = out_dir / repo.out_name if repo_exists else None
+                repo.snapshot_commits = list(state.get('snapshot_commits', None) or [])
+                repo.snapshot_paths = [Path(path) if path is not None and Path(path).exists() else None for path in state.get('snapshot_paths', None) or []]
+            elif state is not None:
+                # the commit search is the slow part, reuse its result and redo the clone from scratch
+                repo.commit_hash = state.get('commit', None)
+                if (out_dir / repo.out_name).exists():
+                    shutil.rmtree(out_dir / repo.out_name, onexc=onerror)
+            repo.journal = journal
+        if clone_engine is not None and batch is None:
+            clone_engine.start()
         p_thread = None
-        if not debug:
+        if not debug and batch is None:
             from threading import Thread
 
             p_thread = Thread(target=repo_status_print_loop, args=(repos, max_name_len, max_user_len), daemon=True)
             p_thread.start()
-        with ThreadPoolExecutor(max_workers=int((os.cpu_count() * 1.5) if not debug else 1)) as executor:
-            get_futures = {}
+
+        def log_repo(message: str, repo: GitRepo) -> None:
+            # the repo keeps changing as the run goes on, its fields are copied now and formatted when the log is flushed
+            state = repo.debug_state()
+            log_handler.info(lambda: f'{message}, repo={pformat(state)}')
+
+        def info_stage(repo: GitRepo) -> bool:
+            repo.get_info()
+            if repo.status == RepoStatus.RETRIEVED and size_limit:
+                repo_size = client.get_repo_size(repo)
+                repo.oversized = repo_size > size_limit
+                if not repo_size:
+                    unknown_sizes.append(repo)
+            return repo.status == RepoStatus.RETRIEVED
+
+        def commit_stage(repo: GitRepo) -> bool:
+            if repo.commit_hash is not None and not extra_deadlines:
+                repo.status = RepoStatus.COMMIT_FOUND  # resolved before the run was interrupted
+                return True
             if current_pull:
-                get_futures = {executor.submit(client.get_push_count, repo): repo for repo in get_repos_info(repos)}
-            else:
-                get_futures = {executor.submit(client.get_commit_before_by_repo, due_datetime, repo): repo for repo in get_repos_info(repos)}
-            clone_futures = {}
-            for future in as_completed(get_futures):
-                due_commit = future.result()
-                repo: GitHubRepo = get_futures[future]
+                num_pushes = client.get_push_count(repo)
                 if debug:
-                    log_handler.info(f'Get Future Done: {due_commit}, repo={pformat_objects(repo)}')
-                if repo.status == RepoStatus.NOT_FOUND:
-                    num_not_accepted += 1
-                    continue
-                num_repos += 1
-                if repo.status == RepoStatus.NO_COMMITS:
-                    num_no_commit += 1
-                    # check_dups_futures[executor.submit(repo.find_duplicates)] = repo
-                    continue
-                if repo.status == RepoStatus.COMMIT_NOT_FOUND:
-                    num_not_accepted += 1
-                    continue
-                if not current_pull:
-                    skip_flag = False
-                    clone_futures[executor.submit(repo.clone_and_reset, due_commit, out_dir, dry_run=dry_run)] = repo
+                    log_repo(f'Push Count Done: {num_pushes}', repo)
+                return repo.status == RepoStatus.CHECKING_COMMITS and bool(num_pushes) and num_pushes > 0
+            if extra_deadlines:
+                # one activity read gives the commit for every deadline, the student's extra hours move all of them
+                repo_due_datetime = due_datetime + repo.hours_adjust
+                commit_hashes = client.get_commits_before_by_repo([repo_due_datetime] + [repo_due_datetime + timedelta(hours=hours) for hours in extra_deadlines], repo)
+                repo.commit_hash, repo.snapshot_commits = commit_hashes[0], commit_hashes[1:]
+                if journal is not None and repo.commit_hash is not None:
+                    journal.record(repo)
+                if debug:
+                    log_repo(f'Commit Search Done: {commit_hashes}', repo)
+                return repo.status == RepoStatus.COMMIT_FOUND
+            repo.commit_hash = client.get_commit_before_by_repo(due_datetime + repo.hours_adjust, repo)
+            if journal is not None and repo.commit_hash is not None:
+                journal.record(repo)
+            if debug:
+                log_repo(f'Commit Search Done: {repo.commit_hash}', repo)
+            return repo.status == RepoStatus.COMMIT_FOUND
+
+        def clone_steps(repo: GitRepo):
+            commit_hash = repo.commit_hash if not current_pull else None
+            repo_blob_limit = blob_limit if repo.oversized else None
+            shallow_since = due_datetime + repo.hours_adjust - history_window if history_window is not None else None
+            if update_in_place and (out_dir / repo.out_name / '.git').exists():
+                return repo.fetch_update_steps(commit_hash, out_dir, dry_run=dry_run)
+            elif extra_deadlines:
+                # one clone with the history of every deadline, `snapshot_steps` checks each one out from it
+                if (snapshot_store / repo.out_name).exists():
+                    shutil.rmtree(snapshot_store / repo.out_name, onexc=onerror)
+                return repo.clone_steps(snapshot_store, dry_run=dry_run, mirror_cache=mirror_cache, object_store=object_store, no_checkout=True, blob_limit=repo_blob_limit, shallow_since=shallow_since, sparse_paths=sparse_paths)
+            elif current_pull:
+                return repo.clone_steps(out_dir, depth=1, use_cloned_done=True, dry_run=dry_run, mirror_cache=mirror_cache, object_store=object_store, blob_limit=repo_blob_limit, sparse_paths=sparse_paths)
+            elif clone_strategy == CloneStrategy.FULL:
+                return repo.clone_steps(out_dir, dry_run=dry_run, mirror_cache=mirror_cache, object_store=object_store, no_checkout=defer_checkout, blob_limit=repo_blob_limit, shallow_since=shallow_since, sparse_paths=sparse_paths)
+            return repo.fetch_commit_steps(commit_hash, out_dir, clone_strategy, dry_run=dry_run, mirror_cache=mirror_cache, object_store=object_store, blob_limit=repo_blob_limit, sparse_paths=sparse_paths)
+
+        def ssh_counted(steps):
+            return ssh_commands.count_steps(steps) if ssh_commands is not None else steps
+
+        def clone_stage(repo: GitRepo) -> bool:
+            clone_result = run_steps(ssh_counted(clone_steps(repo)), git_limiter, retry_policy, repo.trace, git_env)
+            if journal is not None:
+                journal.record(repo, exitcode=clone_result[2])
+            if debug:
+                log_repo(f'Clone Done: {clone_result}', repo)
+            return repo.status == RepoStatus.CLONED
+
+        def checkout_steps(repo: GitRepo):
+            if extra_deadlines:
+                return repo.snapshot_steps([repo.commit_hash] + repo.snapshot_commits, [out_dir] + snapshot_dirs, dry_run=dry_run, checkout_workers=checkout_workers())
+            return repo.reset_steps(repo.commit_hash, dry_run=dry_run, checkout_workers=checkout_workers())
+
+        def checkout_workers() -> int | None:
+            # split the cores between the checkouts running at once
+            return max(1, (os.cpu_count() or 1) // checkout_limiter.current) if defer_checkout else None
+
+        def archive_stage(repo: GitRepo) -> bool:
+            download_result = repo.download(repo.commit_hash if not current_pull else None, out_dir, dry_run=dry_run)
+            if journal is not None:
+                journal.record(repo, exitcode=download_result[2])
+            if debug:
+                log_repo(f'Download Done: {download_result}', repo)
+            return False
+
+        def reset_stage(repo: GitRepo) -> bool:
+            if defer_checkout:
+                checkout_limiter.acquire()
+            start = perf_counter()
+            try:
+                # the limiter only applies to the fetches deepening a history trimmed clone
+                reset_result = run_steps(ssh_counted(checkout_steps(repo)), git_limiter, retry_policy, repo.trace, git_env)
+            finally:
+                if defer_checkout:
+                    checkout_limiter.release(perf_counter() - start)
+            if debug:
+                log_repo(f'Reset Done: {reset_result}', repo)
+            return index_repos and repo.status in (RepoStatus.RESET, RepoStatus.TRUNCATED)
+
+        def index_stage(repo: GitRepo) -> bool:
+            start = perf_counter()
+            index_result = run_steps(repo.write_indexes_steps(), policy=retry_policy)
+            index_seconds.append(perf_counter() - start)
+            if debug:
+                log_repo(f'Index Done: {index_result}', repo)
+            return False
+
+        async def async_clone_stage(repo: GitRepo):
+            try:
+                if mirror_cache is None and object_store is None:
+                    clone_result = await clone_engine.run_steps(ssh_counted(clone_steps(repo)), repo.trace, git_env)
                 else:
-                    skip_flag = False
-                    clone_futures[executor.submit(repo.clone, out_dir, depth=1, use_cloned_done=True, dry_run=dry_run)] = repo
-
-            for future in as_completed(clone_futures):
-                clone_result, reset_result = None, None
-                if not dry_run and not current_pull:
-                    clone_result, reset_result = future.result()
-                elif not dry_run and current_pull:
-                    clone_result = future.result()
-                repo: GitHubRepo = clone_futures[future]
+                    # mirror updates and store seeding block on locks, keep them off the event loop
+                    clone_result = await asyncio.to_thread(run_steps, ssh_counted(clone_steps(repo)), git_limiter, retry_policy, repo.trace, git_env)
+                if journal is not None:
+                    journal.record(repo, exitcode=clone_result[2])
                 if debug:
-                    log_handler.info(f'Clone Future Done: {clone_result}, {reset_result}, repo={pformat_objects(repo)}')
-                if clone_result is not None and clone_result[2] == 0:
-                    num_cloned += 1
-                if reset_result is not None and reset_result[2] == 0:
-                    num_reset += 1
+                    log_repo(f'Clone Done: {clone_result}', repo)
+                if repo.status == RepoStatus.CLONED:
+                    if defer_checkout:
+                        await checkout_limiter.async_acquire()
+                    start = perf_counter()
+                    try:
+                        reset_result = await clone_engine.run_steps(ssh_counted(checkout_steps(repo)), repo.trace, git_env)
+                    finally:
+                        if defer_checkout:
+                            checkout_limiter.release(perf_counter() - start)
+                    if debug:
+                        log_repo(f'Reset Done: {reset_result}', repo)
+                if index_repos and repo.status in (RepoStatus.RESET, RepoStatus.TRUNCATED):
+                    async with index_semaphore:
+                        start = perf_counter()
+                        index_result = await clone_engine.run_steps(repo.write_indexes_steps())
+                        index_seconds.append(perf_counter() - start)
+                    if debug:
+                        log_repo(f'Index Done: {index_result}', repo)
+            except Exception as e:
+                repo.status = RepoStatus.ERROR
+                log_handler.error(f'{repo.get_name()}: {e!r}')
+
+        clone_futures = []
+
+        def submit_clone_stage(repo: GitRepo) -> bool:
+            clone_futures.append(clone_engine.submit(async_clone_stage(repo)))
+            return False
+
+        # every stage runs as tasks on the client's scheduler, whose threads are shared with every other assignment of a batch
+        # api and clone stages only start as many repos as their adaptive limiter allows right now, the rest wait as references
+        # once sizes are known repos go largest first (LPT) so a few big repos do not start last and set the total time
+        cpu_count = os.cpu_count() or 1
+        largest_first = lambda repo: -repo.get_size()
+        api_limit = lambda: client.request_limiter.current
+        clone_limit = lambda: git_limiter.current
+        reset_limit = cpu_count
+        if defer_checkout:
+            # checkout is its own disk bound stage, the checkout limiter decides how many run at once
+            reset_limit = lambda: checkout_limiter.current
+        # indexing is CPU bound background work, a few at a time keeps it from competing with checkouts still running
+        index_workers = max(1, cpu_count // 4)
+        index_semaphore = asyncio.Semaphore(index_workers)
+        stages = [
+            PipelineStage('info', info_stage, api_limit),
+            PipelineStage('commit', commit_stage, api_limit, priority=largest_first),
+        ]
+        if use_archive:
+            stages.append(PipelineStage('download', archive_stage, api_limit, priority=largest_first))
+        elif clone_engine is None:
+            stages.append(PipelineStage('clone', clone_stage, clone_limit, priority=largest_first))
+            stages.append(PipelineStage('reset', reset_stage, reset_limit))
+            if index_repos:
+                stages.append(PipelineStage('index', index_stage, index_workers))
+        else:
+            # git processes are bounded by the engine semaphore, one task at a time is enough to hand repos over
+            stages.append(PipelineStage('clone', submit_clone_stage, 1))
+        pipeline = Pipeline(stages, client.scheduler)
+        for repo, error in pipeline.run(repo for repo in repos if not repo.status.value[3]):
+            repo.status = RepoStatus.ERROR
+            log_handler.error(f'{repo.get_name()}: {error!r}')
+        for future in clone_futures:
+            future.exception()  # async_clone_stage handles its own errors, only wait for it
+        if git_proxy is not None and not dry_run:
+            # the proxy stops with the run, fetches after it go straight to upstream
+            for repo in repos:
+                local_path = snapshot_store / repo.out_name if extra_deadlines else repo.local_path
+                if local_path is not None and (Path(local_path) / '.git').exists():
+                    repo.unproxy_remote(local_path, retry_policy)
 
-        if not debug:
+        for repo in repos:
+            if repo.status == RepoStatus.NOT_FOUND:
+                num_not_accepted += 1
+                continue
+            num_repos += 1
+            if repo.status == RepoStatus.NO_COMMITS:
+                num_no_commit += 1
+            elif repo.status == RepoStatus.COMMIT_NOT_FOUND:
+                num_not_accepted += 1
+            if dry_run:
+                continue
+            if repo.status in (RepoStatus.CLONED_DONE, RepoStatus.RESET, RepoStatus.RESET_ERROR, RepoStatus.UP_TO_DATE, RepoStatus.DOWNLOADED, RepoStatus.TRUNCATED):
+                num_cloned += 1
+            if repo.status in (RepoStatus.RESET, RepoStatus.UP_TO_DATE, RepoStatus.DOWNLOADED, RepoStatus.TRUNCATED):
+                num_reset += 1
+        skip_flag = not any(repo.local_path is not None for repo in repos)
+
+        if p_thread is not None:
             p_thread.join()
             log_handler.info('Repo status print thread done.')
         pull_stop = perf_counter()
         ellapsed_time = (pull_stop - pull_start) + (stop_1 - start_1) + (stop_2 - start_2) + (stop_3 - start_3)
 
-        clear()
+        if batch is None:
+            clear()
         print('Clone Source:'.ljust(23), f'`{clone_source}`')
         print('Repo Prefix:'.ljust(23), f'`{repo_prefix}`')
         print('Due Date:'.ljust(23), f'`{due_date}`')
@@ -1164,6 +2315,11 @@ def main(preset=None, dry_run=None, config_manager=None):
         print('Adj. Date/Time (Local):'.ljust(23), f'`{due_datetime + timedelta(hours=UTC_OFFSET)} {CURRENT_TIMEZONE}`')
         print('Current Pull:'.ljust(23), f'`{current_pull}`')
         print('Dry Run:'.ljust(23), f'`{dry_run}`')
+        print('Clone Strategy:'.ljust(23), f'`{clone_strategy.value}`')
+        if extra_deadlines:
+            print('Late Deadlines:'.ljust(23), f'`{", ".join(f"+{hours}h" for hours in extra_deadlines)}`')
+        if sparse_paths:
+            print('Sparse Folders:'.ljust(23), f'`{", ".join(sparse_paths)}`')
         print('Append Timestamp:'.ljust(23), f'`{append_timestamp}`')
         print('Folder Suffix:'.ljust(23), f'`{folder_suffix}`')
         print('Output directory:'.ljust(23), f'`{out_dir}`')
@@ -1179,11 +2335,61 @@ def main(preset=None, dry_run=None, config_manager=None):
         if not skip_flag and not dry_run:
             extract_data_folder(out_dir)
             create_vscode_workspace(out_dir, repo_prefix, repos)
+        for i, snapshot_dir in enumerate(snapshot_dirs):
+            snapshot_names = [repo.out_name for repo in repos if len(repo.snapshot_paths) > i and repo.snapshot_paths[i] is not None]
+            if snapshot_names and not dry_run:
+                extract_data_folder(snapshot_dir)
+                create_vscode_workspace(snapshot_dir, repo_prefix, repos, snapshot_names)
         report_str = print_pull_report(students, num_repos, num_not_accepted, num_no_commit, num_cloned, num_reset, ellapsed_time, dry_run, current_pull)
+        if snapshot_dirs:
+            report_str += print_snapshot_report(repos, extra_deadlines, snapshot_dirs)
+        if any(repo.oversized for repo in repos):
+            report_str += print_oversized_report(repos, preset.size_limit, max_name_len, max_user_len)
+        if unknown_sizes:
+            unknown_size_str = f'{YELLOW}[WARNING]: {len(unknown_sizes)} repos have no size reported by the API, the size limit was not applied to them.{WHITE}'
+            print(unknown_size_str)
+            report_str += f'\n{unknown_size_str}'
+        concurrency_str = f'{CYAN}[INFO]: {client.request_limiter.summary()}\n[INFO]: {git_limiter.summary()}\n[INFO]: {retry_policy.summary()}\n[INFO]: {client.scheduler.summary()}'
+        if defer_checkout:
+            concurrency_str += f'\n[INFO]: {checkout_limiter.summary()}'
+        if history_window is not None and not current_pull:
+            num_trimmed = sum(1 for repo in repos if repo.shallow_since is not None)
+            num_deepened = sum(1 for repo in repos if repo.deepened)
+            concurrency_str += f'\n[INFO]: History trimmed to {history_window.days} days before the due datetime in {num_trimmed} repos, {num_deepened} had to be deepened to reach their due commit'
+        if git_proxy is not None:
+            concurrency_str += f'\n[INFO]: {git_proxy.summary()}'
+        if ssh_commands is not None:
+            concurrency_str += f'\n[INFO]: {ssh.summary(ssh_commands.num_commands, num_cloned)}'
+        if trace_dir is not None:
+            concurrency_str += f'\n[INFO]: {trace_summary([repo.trace for repo in repos if repo.trace is not None and repo.trace.num_commands])}'
+        if index_seconds:
+            num_indexed = sum(1 for repo in repos if repo.indexed)
+            concurrency_str += f'\n[INFO]: Commit graphs and multi-pack indexes written for {num_indexed}/{len(index_seconds)} repos (shallow repos skipped) in {round(sum(index_seconds), 2)}s of background git time'
+        concurrency_str += WHITE
+        print(concurrency_str)
+        report_str += f'\n{concurrency_str}'
+        if dry_run:
+            to_clone = [repo for repo in repos if repo.local_path is not None]
+            num_api_calls = client.request_limiter.num_calls - api_calls_start
+            if use_archive:
+                num_api_calls += len(to_clone)  # one archive download per repo
+            api_seconds = num_api_calls * (client.request_limiter.avg_latency or 0) / client.request_limiter.current
+            estimate = PreflightEstimate(
+                [repo.get_size() for repo in to_clone],
+                client.request_limiter.current if use_archive else git_limiter.current,
+                num_api_calls,
+                api_seconds,
+                out_dir,
+                archive=use_archive,
+                rate_limit_remaining=client.rate_limit_remaining,
+            )
+            preflight_str = f'{CYAN if estimate.fits_on_disk else LIGHT_RED}[INFO]: ' + estimate.summary().replace('\n', '\n[INFO]: ') + WHITE
+            print(preflight_str)
+            report_str += f'\n{preflight_str}'
         if debug:
             log_handler.info(report_str)
             for repo in repos:
-                log_handler.info(pformat_objects(repo))
+                log_repo('Final State', repo)
 
         for repo in repos:
             repo_final_output = f'  > {build_repo_and_info_str(repo, repo.status.value[1], max_name_len, max_user_len, color=repo.status.value[2])}'
@@ -1192,9 +2398,32 @@ def main(preset=None, dry_run=None, config_manager=None):
 
         prints_log.append(report_str)
 
-        clone_report = CloneReport(repo_prefix, due_date, due_time, datetime.today().strftime('%Y-%m-%d'), datetime.now().strftime('%H:%M'), dry_run, students_path, prints_log)
+        repo_outcomes = tuple((repo.out_name, repo.status.name, repo.commit_hash, tuple(repo.snapshot_commits), tuple(str(path) if path is not None else None for path in repo.snapshot_paths)) for repo in repos)
+        clone_report = CloneReport(
+            repo_prefix,
+            due_date,
+            due_time,
+            datetime.today().strftime('%Y-%m-%d'),
+            datetime.now().strftime('%H:%M'),
+            dry_run,
+            students_path,
+            prints_log,
+            str(out_dir),
+            clone_source,
+            clone_strategy.value,
+            flags,
+            current_pull,
+            repo_outcomes,
+            preset.size_limit,
+            preset.blob_limit,
+            tuple(extra_deadlines),
+            tuple(str(snapshot_dir) for snapshot_dir in snapshot_dirs),
+            tuple(sparse_paths),
+        )
 
-        save_report(clone_report, config_manager)
+        save_report(clone_report, config_manager, replace=retry_report)
+        if journal is not None:
+            journal.finish()
     except Exception as e:
         if repos_created:
             for repo in repos:
@@ -1207,8 +2436,25 @@ def main(preset=None, dry_run=None, config_manager=None):
         raise e
     except KeyboardInterrupt:
         print()
+        if client is not None:
+            client.scheduler.cancel_pending()
+        if journal is not None and journal.file_handle is not None:
+            print(f'{CYAN}[INFO]: Progress saved, start the same clone again to resume it.{WHITE}')
         return
     finally:
+        if journal is not None:
+            journal.close()
+        if clone_engine is not None and batch is None:
+            clone_engine.close()
+        if git_proxy is not None and batch is None:
+            git_proxy.close()
+            client.git_proxy = None
+        if ssh is not None and batch is None:
+            ssh.close()
+            client.ssh = None
+        if trace_dir is not None:
+            shutil.rmtree(trace_dir, ignore_errors=True)
         log_handler.close()
-        client.close()
+        if client is not None and batch is None:
+            client.close()
         gc.collect()
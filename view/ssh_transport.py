@@ -0,0 +1,119 @@
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from .concurrency import is_network_git_cmd
+
+DEFAULT_CONTROL_PERSIST = 60
+
+
+def ssh_destination(ssh_url: str) -> tuple[str, str | None]:
+    """
+    (user@host, port) of an ssh clone url, either ssh://user@host:port/path or scp like user@host:path
+    """
+    if ssh_url.startswith('ssh://'):
+        parts = urlsplit(ssh_url)
+        user = f'{parts.username}@' if parts.username else ''
+        return f'{user}{parts.hostname}', str(parts.port) if parts.port else None
+    return ssh_url.split(':', 1)[0], None
+
+
+class SshMultiplexer:
+    """
+    Shares one ssh connection per host between every git command of a run (OpenSSH ControlMaster/ControlPersist),
+    so each clone skips the TCP, key exchange and authentication round trips of a connection of its own.
+    Control sockets are kept in a private temporary folder that is removed on close.
+    Only the git commands given `git_env()` use it, the environment of this process is never changed.
+    OpenSSH on Windows cannot multiplex, there every command connects on its own.
+    """
+
+    def __init__(self, control_persist: int = DEFAULT_CONTROL_PERSIST) -> None:
+        self.control_persist = control_persist
+        self.multiplex = os.name != 'nt'
+        self.control_dir = Path(tempfile.mkdtemp(prefix='gcis-ssh-')) if self.multiplex else None  # mkdtemp folders are only accessible by the user
+        self.handshake_seconds = {}  # (destination, port) -> seconds opening its master connection took, None if it failed
+        self.lock = Lock()
+
+    def ssh_args(self) -> list[str]:
+        # host keys are checked as the user's ssh config says, BatchMode fails a host that would need a prompt instead of asking
+        args = ['ssh', '-o', 'BatchMode=yes']
+        if self.multiplex:
+            args.extend(['-o', 'ControlMaster=auto', '-o', f'ControlPath={self.control_dir / "%C"}', '-o', f'ControlPersist={self.control_persist}'])
+        return args
+
+    def git_env(self) -> dict:
+        """
+        Environment for a git command that should use the multiplexed ssh command
+        """
+        return dict(os.environ, GIT_SSH_COMMAND=shlex.join(self.ssh_args()))
+
+    def connect(self, ssh_url: str) -> None:
+        """
+        Open the master connection for the host of ssh_url if there is none yet.
+        Clones wait for it instead of racing to open connections of their own.
+        """
+        destination, port = ssh_destination(ssh_url)
+        with self.lock:
+            # the control socket of a connection is per user, host and port, so is its master
+            if (destination, port) in self.handshake_seconds or not self.multiplex:
+                return
+            cmd = self.ssh_args() + (['-p', port] if port else []) + ['-T', destination]
+            start = perf_counter()
+            try:
+                # GitHub and GitLab greet and close the session, the master stays open for ControlPersist seconds
+                result = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, timeout=60)
+                self.handshake_seconds[(destination, port)] = perf_counter() - start if result.returncode != 255 else None
+            except subprocess.TimeoutExpired:
+                self.handshake_seconds[(destination, port)] = None
+
+    def close(self) -> None:
+        if not self.multiplex:
+            return
+        for destination, port in self.handshake_seconds:
+            subprocess.run(self.ssh_args() + (['-p', port] if port else []) + ['-O', 'exit', destination], stdin=subprocess.DEVNULL, capture_output=True)
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+
+    def summary(self, num_git_commands: int, num_repos: int) -> str:
+        """
+        Every git command on a shared connection skips one handshake, each takes about as long as opening a master did
+        """
+        handshakes = [seconds for seconds in self.handshake_seconds.values() if seconds is not None]
+        if not handshakes:
+            return f'SSH: {num_git_commands} git commands, each on its own connection'
+        per_handshake = sum(handshakes) / len(handshakes)
+        num_avoided = max(0, num_git_commands - len(handshakes))
+        saved = per_handshake * num_avoided
+        per_repo_str = f', {round(saved / num_repos * 1000)}ms per repo' if num_repos else ''
+        return f'SSH: {len(handshakes)} shared connections used by {num_git_commands} git commands, {num_avoided} handshakes of {round(per_handshake * 1000)}ms avoided ({round(saved, 2)}s saved{per_repo_str})'
+
+
+class SshCommandCounter:
+    """
+    Network git commands one run sent over the shared connections, runs of a batch share the connections but each counts its own
+    """
+
+    def __init__(self) -> None:
+        self.num_commands = 0
+        self.lock = Lock()
+
+    def count_steps(self, steps):
+        """
+        Pass a git step generator through unchanged, counting the clones and fetches it yields
+        """
+        result = None
+        try:
+            while True:
+                cmd, cwd = steps.send(result)
+                if is_network_git_cmd(cmd):
+                    with self.lock:
+                        self.num_commands += 1
+                result = yield cmd, cwd
+        except StopIteration as e:
+            return e.value